@@ -0,0 +1,191 @@
+# agent/answer_cache.py
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from rag.vector_store import embedding_function
+from agent.single_flight import normalize_prompt
+from core import metrics
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+# Opt-in: a hit returns an answer written for an earlier question
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+
+def _partition_key(
+    user_id: int,
+    question: str,
+    context: str | None,
+    model: str,
+    prompt_version: str,
+) -> int:
+    # 🔒 None (no document) and "" (document, nothing found) must not collide.
+    # Without a context nothing grounds the answer, so only the same
+    # (normalized) question may reuse it: "Python 3.11" vs "Python 3.12"
+    # embed almost identically.
+    if context is None:
+        context_marker = "\x00none\x1f" + normalize_prompt(question)
+    else:
+        context_marker = context
+    digest = hashlib.blake2b(
+        f"{user_id}\x1f{model}\x1f{prompt_version}\x1f{context_marker}".encode("utf-8"),
+        digest_size=8,
+    ).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class SemanticAnswerCache:
+    """
+    Fixed-size in-memory cache of answers keyed by question embedding.
+
+    An entry matches when it belongs to the same partition
+    (user, context hash, model, prompt version; the question itself
+    when there is no context) and the cosine similarity of the
+    questions is above the threshold. All slots live in
+    preallocated numpy arrays so a lookup is one masked mat-vec.
+    Expired slots are reused first, then the least recently used one.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self._lock = threading.Lock()
+        self._vectors = None  # allocated on first insert (dim unknown before)
+        self._partitions = np.zeros(max_entries, dtype=np.int64)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._answers: list = [None] * max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def embed(question: str) -> np.ndarray:
+        vector = np.asarray(embedding_function.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector: np.ndarray, partition: int) -> str | None:
+        now = time.time()
+
+        with self._lock:
+            if self._vectors is None:
+                self.misses += 1
+                return None
+
+            live = (self._partitions == partition) & (self._expires_at > now)
+            candidates = np.flatnonzero(live)
+
+            if candidates.size == 0:
+                self.misses += 1
+                return None
+
+            scores = self._vectors[candidates] @ vector
+            best = int(np.argmax(scores))
+
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = candidates[best]
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._answers[slot]
+
+    def store(self, vector: np.ndarray, partition: int, answer: str) -> None:
+        now = time.time()
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros(
+                    (self.max_entries, vector.shape[0]), dtype=np.float32
+                )
+
+            expired = np.flatnonzero(self._expires_at <= now)
+            if expired.size:
+                slot = int(expired[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+
+            self._vectors[slot] = vector
+            self._partitions[slot] = partition
+            self._expires_at[slot] = now + self.ttl_seconds
+            self._last_used[slot] = now
+            self._answers[slot] = answer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires_at[:] = 0
+            self._answers = [None] * self.max_entries
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "entries": int(np.count_nonzero(self._expires_at > time.time())),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    threshold=ANSWER_CACHE_SIMILARITY,
+)
+
+# Read from the cache's own counters at scrape time
+metrics.callback(
+    "answer_cache_lookups_total",
+    "Semantic answer cache lookups by result",
+    lambda: {("hit",): answer_cache.hits, ("miss",): answer_cache.misses},
+    kind="counter",
+    labelnames=("result",),
+)
+metrics.callback(
+    "answer_cache_entries",
+    "Live entries in the semantic answer cache",
+    lambda: answer_cache.stats()["entries"],
+)
+
+
+# ------------------------------------------------
+# PUBLIC API (ANSWER GENERATOR CALLS THIS)
+# ------------------------------------------------
+def lookup_answer(
+    question: str,
+    context: str | None,
+    model: str,
+    prompt_version: str,
+    user_id: int,
+):
+    """
+    Returns (answer or None, cache_key). Pass cache_key to store_answer
+    after a miss so the question is only embedded once. Answers are
+    never shared between users.
+    """
+    partition = _partition_key(user_id, question, context, model, prompt_version)
+    vector = answer_cache.embed(question)
+    return answer_cache.lookup(vector, partition), (vector, partition)
+
+
+def store_answer(cache_key, answer: str) -> None:
+    if not answer:
+        return
+    vector, partition = cache_key
+    answer_cache.store(vector, partition, answer)
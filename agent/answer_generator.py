@@ -1,15 +1,11 @@
 # agent/answer_generator.py
 
-from groq import Groq
+import hashlib
 
-client = Groq()
+from agent.llm_client import DEFAULT_MODEL, chat_completion, stream_chat_completion
+from agent.answer_cache import ANSWER_CACHE_ENABLED, lookup_answer, store_answer
 
-
-def generate_answer(question: str = "", context: str | None = None) -> str:
-    if not question:
-        return "No question provided."
-
-    system_prompt = """
+SYSTEM_PROMPT = """
 You are a helpful and honest assistant.
 
 Rules:
@@ -24,7 +20,12 @@ Rules:
 Be concise, factual, and clear.
 """
 
-    messages = [{"role": "system", "content": system_prompt}]
+# Cached answers are only reused for the exact prompt they were made with
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def build_messages(question: str, context: str | None) -> list:
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
 
     # 🔒 CRITICAL FIX: distinguish None vs ""
     if context is not None:
@@ -36,11 +37,93 @@ Be concise, factual, and clear.
         )
 
     messages.append({"role": "user", "content": question})
+    return messages
+
+
+def generate_answer(
+    question: str = "",
+    context: str | None = None,
+    on_token=None,
+    cancel_event=None,
+    fresh: bool = False,
+    max_tokens: int | None = None,
+    user_id: int | None = None,
+) -> str:
+    if not question:
+        return "No question provided."
+
+    messages = build_messages(question, context)
+
+    # fresh=True bypasses the semantic cache (always ask the model);
+    # entries are per user, so callers without one never use it
+    if fresh or not ANSWER_CACHE_ENABLED or user_id is None:
+        return complete_answer(messages, on_token, cancel_event, max_tokens)
+
+    answer, cache_key = lookup_answer(
+        question, context, DEFAULT_MODEL, PROMPT_VERSION, user_id
+    )
+    if answer is not None:
+        if on_token is not None:
+            on_token(answer)
+        return answer
 
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
+    answer = complete_answer(messages, on_token, cancel_event, max_tokens)
+
+    # 🔒 Never cache a partial answer from a cancelled stream
+    if cancel_event is None or not cancel_event.is_set():
+        store_answer(cache_key, answer)
+
+    return answer
+
+
+def complete_answer(
+    messages: list,
+    on_token=None,
+    cancel_event=None,
+    max_tokens: int | None = None,
+) -> str:
+    # Completion cap set by the engine from the remaining run budget
+    limits = {"max_tokens": max_tokens} if max_tokens else {}
+
+    # Streaming mode: tokens are pushed to the caller as they arrive
+    if on_token is not None:
+        return stream_answer(messages, on_token, cancel_event, **limits)
+
+    response = chat_completion(
+        "generate_answer",
         messages=messages,
         temperature=0.3,
+        **limits,
     )
 
     return response.choices[0].message.content.strip()
+
+
+def stream_answer(messages: list, on_token, cancel_event=None, **limits) -> str:
+    """
+    Stream the completion token by token.
+    If cancel_event is set (client went away), the upstream
+    completion is closed and the partial answer is returned.
+    """
+    parts = []
+
+    # 🔒 Leaving the block closes the response, aborting upstream generation
+    with stream_chat_completion(
+        "generate_answer",
+        messages=messages,
+        temperature=0.3,
+        **limits,
+    ) as stream:
+        for chunk in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+
+            if not chunk.choices:
+                continue
+
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+
+    return "".join(parts).strip()
@@ -0,0 +1,252 @@
+# agent/audit_writer.py
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from db.database import SessionLocal
+from core import metrics
+from agent.payloads import externalize_payloads, save_blobs
+from agent.usage_rollups import RunUsage, save_rollups
+from models.agent_action import AgentAction
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "0.5"))
+# How long a producer waits for queue space before writing itself
+AUDIT_ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT_SECONDS", "1"))
+
+AUDIT_ROWS_WRITTEN = metrics.counter(
+    "audit_rows_written_total",
+    "Audit rows written by the write-behind writer",
+    ("table",),
+)
+AUDIT_WRITE_ERRORS = metrics.counter(
+    "audit_write_errors_total",
+    "Audit submissions that could not be written (rows dropped)",
+)
+AUDIT_SYNC_WRITES = metrics.counter(
+    "audit_sync_writes_total",
+    "Audit submissions written on the caller thread (queue full or writer stopped)",
+)
+
+
+def _as_row(record) -> dict:
+    """Column values of a transient ORM object, for a bulk INSERT."""
+    mapper = record.__mapper__
+    row = {}
+    for attr in mapper.column_attrs:
+        value = getattr(record, attr.key)
+        if value is not None:
+            row[attr.key] = value
+    return row
+
+
+class AuditWriter:
+    """
+    Write-behind persistence for audit rows (AgentAction, PlannerPlan).
+    RunUsage records update the hourly/daily usage rollups in the same
+    transaction instead of being inserted.
+
+    Runs submit their rows once, after the run itself is committed.
+    A background thread drains the bounded queue and bulk-inserts
+    everything it collected every AUDIT_FLUSH_INTERVAL_SECONDS (or
+    AUDIT_BATCH_SIZE rows), in one transaction per batch. If a batch
+    fails, each submission in it is retried in its own transaction, so
+    one bad run cannot take unrelated runs' rows down with it.
+
+    Backpressure: when the queue is full the producer waits up to
+    AUDIT_ENQUEUE_TIMEOUT_SECONDS, then writes its own rows. Nothing is
+    dropped unless the database write of that submission fails.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # -------- LIFECYCLE --------
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="audit-writer", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush everything queued, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)  # sentinel: drain and exit
+        thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    # -------- PRODUCERS --------
+    def submit(self, records: list) -> None:
+        if not records:
+            return
+
+        # Runs stamp their rows as they happen (agent/engine.py);
+        # this only covers records created without a timestamp
+        now = datetime.now(timezone.utc)
+        rows = []
+        for record in records:
+            if isinstance(record, RunUsage):
+                rows.append((RunUsage, (record, now)))
+                continue
+            row = _as_row(record)
+            row.setdefault("created_at", now)
+            rows.append((type(record), row))
+
+        if self.running:
+            try:
+                self._queue.put(rows, timeout=AUDIT_ENQUEUE_TIMEOUT_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+        AUDIT_SYNC_WRITES.inc()
+        self._write([rows])
+
+    def flush(self) -> None:
+        """Block until everything submitted so far has been written."""
+        if self.running:
+            self._queue.join()
+
+    # -------- WRITER THREAD --------
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            batch = [item]  # one list of rows per submission
+            size = len(item)
+            taken = 1
+            deadline = time.monotonic() + self.flush_interval
+
+            # Collect until the batch is full or the interval elapses
+            while size < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item)
+
+            try:
+                self._write(batch)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+        # Drain whatever is left (shutdown)
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftover.append(item)
+            self._queue.task_done()
+        if leftover:
+            self._write(leftover)
+
+    def _write(self, submissions: list) -> None:
+        if len(submissions) > 1:
+            try:
+                self._insert([row for rows in submissions for row in rows])
+                return
+            except Exception:
+                logger.warning(
+                    "Audit batch write failed, retrying %d submissions one by one",
+                    len(submissions),
+                    exc_info=True,
+                )
+
+        for rows in submissions:
+            try:
+                self._insert(rows)
+            except Exception:
+                AUDIT_WRITE_ERRORS.inc()
+                logger.exception("Audit write failed, %d rows dropped", len(rows))
+
+    def _insert(self, rows: list) -> None:
+        """All rows in one transaction; raises (after rollback) on failure."""
+        by_model = {}
+        for model, row in rows:
+            # Copies: externalizing payloads edits rows in place, and a
+            # failed batch is retried from the original rows
+            by_model.setdefault(model, []).append(row if model is RunUsage else dict(row))
+
+        usage = by_model.pop(RunUsage, [])
+        actions = by_model.get(AgentAction, [])
+
+        # Large tool payloads go to payload_blobs, referenced by hash
+        blobs = externalize_payloads(actions)
+
+        db = SessionLocal()
+        try:
+            save_blobs(db, blobs)
+            for model, values in by_model.items():
+                db.execute(insert(model), values)
+            # One upsert per touched (bucket, user/tool), whatever the batch size
+            save_rollups(db, usage, actions)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        for model, values in by_model.items():
+            AUDIT_ROWS_WRITTEN.inc(len(values), table=model.__tablename__)
+
+
+audit_writer = AuditWriter(
+    max_queue=AUDIT_QUEUE_MAX,
+    batch_size=AUDIT_BATCH_SIZE,
+    flush_interval=AUDIT_FLUSH_INTERVAL_SECONDS,
+)
+
+metrics.callback(
+    "audit_queue_depth",
+    "Run submissions waiting for the audit writer",
+    audit_writer.depth,
+)
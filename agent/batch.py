@@ -0,0 +1,370 @@
+# agent/batch.py
+
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from models.agent_run import AgentRun
+
+from agent.engine import (
+    MAX_PROMPT_CHARS,
+    MAX_TOKENS_PER_RUN,
+    RUN_DEADLINE_ERROR,
+    PlanSteps,
+    plan_prompt,
+    prompt_too_long_error,
+    span,
+    unplanned_result,
+)
+from agent.execution_limits import enforce_run_limit, AgentRateLimitError
+from agent.tool_permissions import is_tool_allowed
+from agent.tool_registry import TOOLS
+from agent.token_budget import TokenMeter, activate_meter, deactivate_meter
+from agent.tool_timeout import (
+    ToolTimeout,
+    Deadline,
+    RUN_DEADLINE_SECONDS,
+    activate_deadline,
+    deactivate_deadline,
+    tool_timeout,
+)
+from agent.plan_executor import SESSION_TOOLS, SKIP, execute_dag
+from rag.retrieve import retrieve_context_batch
+from core.metrics import AGENT_RUNS_IN_FLIGHT
+from agent.audit_writer import audit_writer
+from agent.usage_rollups import RunUsage
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+# Steps processed concurrently per batch (the LLM client's global
+# semaphore still caps in-flight LLM calls process-wide)
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "8"))
+
+
+def _ms(started: float) -> float:
+    return round((time.monotonic() - started) * 1000, 2)
+
+
+def _with_timeout(fn, tool_name: str):
+    """fn() on the plan executor within tool_timeout(tool_name); raises ToolTimeout."""
+    outcome = {}
+
+    def start_step(i: int):
+        return fn, tool_timeout(tool_name)
+
+    def finish_step(i: int, result, error) -> bool:
+        outcome["result"], outcome["error"] = result, error
+        return False
+
+    execute_dag({0: set()}, start_step, finish_step)
+    if outcome["error"] is not None:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def _reaches_retrieval(plan: list, user) -> bool:
+    """
+    Whether the plan can get to its retrieve_context step: every step
+    before it must be allowed and registered, and no create_task may end
+    the run first.
+    """
+    for step in plan:
+        tool_name = step["tool"]
+        try:
+            is_tool_allowed(user, tool_name)
+        except HTTPException:
+            return False
+        if tool_name not in TOOLS or tool_name == "create_task":
+            return False
+        if tool_name == "retrieve_context":
+            return True
+    return False
+
+
+# ------------------------------------------------
+# STAGES
+# ------------------------------------------------
+def _plan_all(items: list, started: float, deadline: Deadline) -> None:
+    """Classifier + planner of every run, in parallel on the plan executor."""
+
+    def start_step(k: int):
+        item = items[k]
+        if deadline.expired():
+            return None
+        run_id, meter = item["run"].id, item["meter"]
+
+        def call():
+            token = activate_meter(meter)
+            try:
+                return plan_prompt(item["prompt"], run_id, meter, started)
+            finally:
+                deactivate_meter(token)
+
+        return call, tool_timeout("planner")
+
+    def finish_step(k: int, result, error) -> bool:
+        item = items[k]
+        if error is None:
+            item["plan"], actions, item["error"] = result
+            item["audit"].extend(actions)
+        elif isinstance(error, ToolTimeout):
+            item["error"] = "ERROR: Tool 'planner' timed out"
+        else:
+            item["error"] = f"ERROR: Planning failed: {str(error)}"
+        return False
+
+    never_started = execute_dag(
+        {k: set() for k in range(len(items))},
+        start_step,
+        finish_step,
+        max_workers=BATCH_MAX_PARALLEL,
+    )
+    for k in never_started:
+        items[k]["error"] = RUN_DEADLINE_ERROR
+
+
+def _retrieve_all(items: list, user, started: float) -> None:
+    """
+    One embedding batch + one vector query for every run whose plan
+    reaches retrieve_context; those steps replay the prefetched result.
+    """
+    rag_items = [i for i in items if _reaches_retrieval(i["plan"], user)]
+    if not rag_items:
+        return
+
+    t = time.monotonic()
+    try:
+        contexts = _with_timeout(
+            lambda: retrieve_context_batch([i["prompt"] for i in rag_items], user.id),
+            "retrieve_context",
+        )
+    except Exception as e:
+        # Reported on each plan's retrieve_context step
+        contexts = [e] * len(rag_items)
+    timing = span(started, t)
+
+    for item, context in zip(rag_items, contexts):
+        item["steps"].prefetched["retrieve_context"] = (context, timing)
+
+
+def _execute_all(items: list) -> None:
+    """
+    Every plan step of every run as one dependency graph: each run keeps
+    its own step order, and session tools of all runs (they share the
+    request session) run one at a time in batch order.
+    """
+    index = []  # global step -> (run's PlanSteps, step index)
+    deps = {}
+    last_session_step = None
+    for item in items:
+        steps = item["steps"]
+        offset = len(index)
+        for i, step in enumerate(steps.planner_steps):
+            g = offset + i
+            index.append((steps, i))
+            deps[g] = {offset + j for j in steps.deps[i]}
+            if step.tool_name in SESSION_TOOLS:
+                if last_session_step is not None:
+                    deps[g].add(last_session_step)
+                last_session_step = g
+
+    def start_step(g: int):
+        steps, i = index[g]
+        # A run that has ended leaves its remaining steps out
+        if steps.stopped is not None:
+            return SKIP
+        try:
+            scheduled = steps.start_step(i)
+        except HTTPException as e:
+            # e.g. a tool this user may not call: ends this run only
+            steps.stop("error", f"ERROR: {e.detail}")
+            return SKIP
+        return SKIP if scheduled is None else scheduled
+
+    def finish_step(g: int, result, error) -> bool:
+        steps, i = index[g]
+        steps.finish_step(i, result, error)
+        return False
+
+    # Steps are only ever skipped, never left unscheduled
+    execute_dag(deps, start_step, finish_step, max_workers=BATCH_MAX_PARALLEL)
+    for item in items:
+        item["steps"].apply_bookkeeping(set())
+
+
+def _fallback_all(items: list) -> None:
+    """Guaranteed fallback answers, in parallel like plan steps."""
+    fallback_items = [i for i in items if i["steps"].needs_fallback()]
+
+    def start_step(k: int):
+        scheduled = fallback_items[k]["steps"].start_fallback(k)
+        return SKIP if scheduled is None else scheduled
+
+    def finish_step(k: int, result, error) -> bool:
+        fallback_items[k]["steps"].finish_fallback(k, result, error)
+        return False
+
+    execute_dag(
+        {k: set() for k in range(len(fallback_items))},
+        start_step,
+        finish_step,
+        max_workers=BATCH_MAX_PARALLEL,
+    )
+
+
+# ------------------------------------------------
+# MAIN ENTRY
+# ------------------------------------------------
+def run_agent_batch(prompts: list[str], user, db, fresh: bool = False) -> dict:
+    """
+    Run many prompts for one user through the same plan steps as
+    /agent/run, amortizing the expensive parts: LLM calls and tools of
+    all runs share one bounded executor, every retrieval shares one
+    embedding batch and one vector query, and the runs are committed
+    together.
+    """
+    started = time.monotonic()
+    timing = {}
+
+    if os.getenv("AGENT_ENABLED", "true").lower() != "true":
+        return {"error": "Agent disabled by ops"}
+
+    # Refused before a run row exists, as in /agent/run
+    accepted = [p for p in prompts if len(p) <= MAX_PROMPT_CHARS]
+
+    # Every accepted prompt counts as one run against the rate limit
+    if accepted:
+        try:
+            enforce_run_limit(user, runs=len(accepted))
+        except AgentRateLimitError as e:
+            return {"error": str(e), "status": 429, "retry_after": e.quota.retry_after}
+
+    # One run deadline for the whole batch; every stage is bounded by it
+    deadline = Deadline(RUN_DEADLINE_SECONDS)
+    deadline_token = activate_deadline(deadline)
+
+    AGENT_RUNS_IN_FLIGHT.inc(len(accepted))
+    try:
+        return _run_batch(prompts, user, db, fresh, started, timing, deadline)
+    finally:
+        AGENT_RUNS_IN_FLIGHT.dec(len(accepted))
+        deactivate_deadline(deadline_token)
+
+
+def _run_batch(
+    prompts: list[str],
+    user,
+    db,
+    fresh: bool,
+    started: float,
+    timing: dict,
+    deadline: Deadline,
+) -> dict:
+    results = [None] * len(prompts)
+    items = []
+
+    for idx, prompt in enumerate(prompts):
+        if len(prompt) > MAX_PROMPT_CHARS:
+            results[idx] = prompt_too_long_error()
+            continue
+
+        items.append(
+            {
+                "index": idx,
+                "prompt": prompt,
+                "run": AgentRun(
+                    user_id=user.id,
+                    input=prompt,
+                    estimated_tokens_used=0,
+                    budget_exceeded=False,
+                ),
+                "meter": TokenMeter(MAX_TOKENS_PER_RUN),
+                "cancel_event": threading.Event(),
+                "audit": [],
+                "plan": [],
+                "error": None,
+                "steps": None,
+            }
+        )
+
+    db.add_all([item["run"] for item in items])
+    db.flush()
+
+    # ------------------------------------------------
+    # 1. CLASSIFY + PLAN (PARALLEL LLM CALLS)
+    # ------------------------------------------------
+    # Stage offsets of every run are relative to the batch start
+    t = time.monotonic()
+    _plan_all(items, started, deadline)
+    timing["planning_ms"] = _ms(t)
+
+    planned = [item for item in items if item["error"] is None]
+    for item in planned:
+        item["steps"] = PlanSteps(
+            item["run"],
+            item["plan"],
+            item["prompt"],
+            user,
+            db,
+            item["meter"],
+            deadline,
+            item["cancel_event"],
+            started,
+            item["audit"],
+            {"fresh": fresh, "cancel_event": item["cancel_event"], "user_id": user.id},
+        )
+
+    # ------------------------------------------------
+    # 2. RETRIEVAL (ONE EMBEDDING BATCH + ONE QUERY)
+    # ------------------------------------------------
+    t = time.monotonic()
+    _retrieve_all(planned, user, started)
+    timing["retrieval_ms"] = _ms(t)
+
+    # ------------------------------------------------
+    # 3. PLAN STEPS + FALLBACK ANSWERS (SHARED EXECUTOR)
+    # ------------------------------------------------
+    t = time.monotonic()
+    _execute_all(planned)
+    _fallback_all(planned)
+    timing["steps_ms"] = _ms(t)
+
+    # ------------------------------------------------
+    # 4. PERSIST RUNS (ONE COMMIT), AUDIT ROWS WRITE-BEHIND
+    # ------------------------------------------------
+    t = time.monotonic()
+    for item in items:
+        if item["steps"] is None:
+            response = unplanned_result(item["run"], item["meter"], item["error"])
+        else:
+            response = item["steps"].finalize()
+        results[item["index"]] = response
+
+    run_ids = [item["run"].id for item in items]  # read before commit expires them
+    db.commit()
+
+    for item, run_id in zip(items, run_ids):
+        response = results[item["index"]]
+        response["run_id"] = run_id
+        item["audit"].append(
+            RunUsage(
+                user_id=user.id,
+                tokens_used=item["meter"].used,
+                failed="error" in response,
+                budget_exceeded=bool(response.get("budget_exceeded") or item["meter"].exceeded),
+            )
+        )
+        audit_writer.submit(item["audit"])
+    timing["persist_ms"] = _ms(t)
+
+    timing["total_ms"] = _ms(started)
+
+    return {
+        "count": len(results),
+        "results": results,
+        "timing": timing,
+    }
@@ -10,23 +10,111 @@ from agent.tool_registry import TOOLS
 from agent.plan_validator import validate_plan
 from agent.langgraph_planner import generate_plan
 from agent.intent_classifier import classify_intent
-from agent.tool_timeout import time_limit, ToolTimeout
-
+from agent.tool_timeout import (
+    ToolTimeout,
+    Deadline,
+    RUN_DEADLINE_SECONDS,
+    activate_deadline,
+    deactivate_deadline,
+    tool_timeout,
+)
+from agent.plan_executor import (
+    PLAN_MAX_WORKERS,
+    SESSION_TOOLS,
+    build_dependency_graph,
+    execute_dag,
+)
+from agent.single_flight import SingleFlight, normalize_prompt
+from rag.compression import CONTEXT_COMPRESSION_ENABLED, compress_context
+from core.stage_timer import stage
+from core.metrics import AGENT_RUNS_IN_FLIGHT
+from agent.audit_writer import audit_writer
+from agent.usage_rollups import RunUsage
+from agent.payloads import loggable_args
+from agent.answer_generator import build_messages
+from agent.token_budget import (
+    TokenMeter,
+    TokenBudgetExceeded,
+    activate_meter,
+    deactivate_meter,
+    estimate_messages_tokens,
+    estimate_tokens,
+    shrink_context,
+)
+
+import logging
 import os
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
 
 
 # ------------------------------------------------
 # TOKEN / COST CONFIG
 # ------------------------------------------------
-MAX_TOKENS_PER_RUN = 2000
-AVG_TOKENS_PER_CHAR = 0.25
+MAX_TOKENS_PER_RUN = int(os.getenv("MAX_TOKENS_PER_RUN", "2000"))
 MAX_PROMPT_CHARS = 3000
 
+# Completion tokens kept free for the final answer when shrinking context
+ANSWER_COMPLETION_RESERVE = 256
+MIN_ANSWER_TOKENS = 64
+# Optional hard cap on answer length (0 = only the run budget applies)
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "0"))
+
+BUDGET_EXCEEDED_ERROR = "ERROR: Token budget exceeded"
+RUN_DEADLINE_ERROR = "ERROR: Run deadline exceeded"
+RUN_CANCELLED_ERROR = "ERROR: Run cancelled by client"
+
+# Stage names reported in request timings (see core/stage_timer.py)
+TOOL_STAGES = {
+    "retrieve_context": "retrieval",
+    "generate_answer": "answer",
+}
+
+
+def fit_answer_to_budget(meter: TokenMeter, prompt: str, context: str | None):
+    """
+    Returns (context, max_tokens) for generate_answer so that prompt +
+    completion stay within the remaining run budget. Context is shrunk
+    until ANSWER_COMPLETION_RESERVE tokens are left for the answer, which
+    may then use everything the prompt does not; if even the bare
+    question does not fit, the run is aborted.
+    """
+    remaining = meter.remaining
+    base = estimate_messages_tokens(
+        build_messages(prompt, "" if context is not None else None)
+    )
+
+    if remaining < base + MIN_ANSWER_TOKENS:
+        raise TokenBudgetExceeded(
+            f"{remaining} tokens left, answer needs at least {base + MIN_ANSWER_TOKENS}"
+        )
+
+    if context:
+        reserve = min(ANSWER_COMPLETION_RESERVE, remaining - base)
+        context = shrink_context(context, remaining - base - reserve)
+
+    max_tokens = remaining - base - estimate_tokens(context)
+    if ANSWER_MAX_TOKENS > 0:
+        max_tokens = min(max_tokens, ANSWER_MAX_TOKENS)
 
-def estimate_tokens(text: str) -> int:
-    if not text:
-        return 0
-    return int(len(text) * AVG_TOKENS_PER_CHAR)
+    return context, max_tokens
+
+
+def _apply_usage(run: AgentRun, meter: TokenMeter) -> None:
+    # Real usage reported by the LLM, not a character estimate
+    run.estimated_tokens_used = meter.used
+    run.budget_exceeded = bool(run.budget_exceeded or meter.exceeded)
+
+
+def _budget_error(run: AgentRun) -> dict:
+    return {
+        "error": BUDGET_EXCEEDED_ERROR,
+        "estimated_tokens_used": run.estimated_tokens_used,
+        "budget_exceeded": True,
+    }
 
 
 # ------------------------------------------------
@@ -47,215 +135,755 @@ def is_rag_allowed(prompt: str) -> bool:
     return any(k in prompt for k in RAG_KEYWORDS)
 
 
+def _no_event(event: str, data) -> None:
+    return None
+
+
+def span(run_started: float, started: float, finished: float | None = None) -> dict:
+    """start_offset_ms / duration_ms of a stage, from time.monotonic() values."""
+    finished = time.monotonic() if finished is None else finished
+    return {
+        "start_offset_ms": round((started - run_started) * 1000, 3),
+        "duration_ms": round((finished - started) * 1000, 3),
+    }
+
+
 # ------------------------------------------------
-# MAIN ENTRY
+# DUPLICATE SUPPRESSION
 # ------------------------------------------------
-def run_agent(prompt: str, user, db):
+# Identical in-flight requests (double clicks, client retries) share one run
+_in_flight_runs = SingleFlight()
 
-    # ------------------------------------------------
-    # 0. OPS KILL SWITCH
-    # ------------------------------------------------
-    if os.getenv("AGENT_ENABLED", "true").lower() != "true":
-        return {"error": "Agent disabled by ops"}
 
-    # ------------------------------------------------
-    # 0.5 HARD INPUT LIMIT
-    # ------------------------------------------------
-    if len(prompt) > MAX_PROMPT_CHARS:
+def find_idempotent_run(db, user_id: int, idempotency_key: str) -> AgentRun | None:
+    return (
+        db.query(AgentRun)
+        .filter(
+            AgentRun.user_id == user_id,
+            AgentRun.idempotency_key == idempotency_key,
+        )
+        .first()
+    )
+
+
+def stored_run_result(run: AgentRun, prompt: str) -> dict:
+    """Response for a retried request, rebuilt from the persisted run."""
+    # A key reused for another prompt must not replay that prompt's result
+    if run.input != prompt:
         return {
-            "error": "Prompt exceeds maximum allowed length",
-            "budget_exceeded": True,
+            "error": "Idempotency-Key was already used with a different prompt",
+            "status": 422,
+            "run_id": run.id,
         }
 
-    # ------------------------------------------------
-    # 1. RATE LIMIT
-    # ------------------------------------------------
+    if run.output is None:
+        return {
+            "error": "A request with this Idempotency-Key is still in progress",
+            "status": 409,
+            "run_id": run.id,
+        }
+
+    if run.output.startswith("ERROR"):
+        return {"error": run.output, "run_id": run.id, "replayed": True}
+
+    return {
+        "result": run.output,
+        "estimated_tokens_used": run.estimated_tokens_used,
+        "budget_exceeded": run.budget_exceeded,
+        "run_id": run.id,
+        "replayed": True,
+    }
+
+
+def _record_failed_run(db, run: AgentRun, meter: TokenMeter, error: Exception) -> bool:
+    """
+    Persist a run that raised (e.g. a tool refused with 403) with an
+    ERROR output, so a retry with its Idempotency-Key replays the
+    failure instead of reporting "still in progress" forever.
+    Returns whether the run row is now committed.
+    """
     try:
-        enforce_run_limit(db, user.id)
-    except AgentRateLimitError as e:
-        return {"error": str(e), "status": 429}
+        # A run that was only flushed comes back as transient: re-add it
+        db.rollback()
+        run.output = f"ERROR: {getattr(error, 'detail', None) or error}"
+        _apply_usage(run, meter)
+        db.add(run)
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        logger.exception("Could not record failed run %s", run.id)
+        return False
 
-    # ------------------------------------------------
-    # 2. CREATE AGENT RUN
-    # ------------------------------------------------
-    run = AgentRun(
-        user_id=user.id,
-        input=prompt,
-        estimated_tokens_used=0,
-        budget_exceeded=False,
-    )
-    db.add(run)
-    db.flush()
 
-    run.estimated_tokens_used += estimate_tokens(prompt)
+# ------------------------------------------------
+# PLANNING + PLAN STEPS (SHARED WITH agent/batch.py)
+# ------------------------------------------------
+def prompt_too_long_error() -> dict:
+    return {
+        "error": "Prompt exceeds maximum allowed length",
+        "budget_exceeded": True,
+    }
 
-    # ------------------------------------------------
-    # 3. INTENT CLASSIFIER (LOGGING ONLY)
-    # ------------------------------------------------
-    intent_data = classify_intent(prompt) or {"intent": "ANSWER"}
 
-    db.add(
+def plan_prompt(prompt: str, run_id: int, meter: TokenMeter, run_started: float, emit=_no_event):
+    """
+    Intent classifier (logging only) + planner for one run.
+
+    Returns (plan, actions, error): error is None or the run output to
+    finish with (see unplanned_result). Nothing shared is modified, so
+    the batch path can run it on the plan executor and drop the result
+    of a call that timed out.
+    """
+    actions = []
+
+    started = time.monotonic()
+    with stage("classifier"):
+        intent_data = classify_intent(prompt) or {"intent": "ANSWER"}
+    emit("intent", intent_data)
+
+    actions.append(
         AgentAction(
-            run_id=run.id,
+            run_id=run_id,
             tool_name="intent_classifier",
             tool_input=prompt,
             tool_output=str(intent_data),
             status="success",
+            created_at=datetime.now(timezone.utc),
+            **span(run_started, started),
         )
     )
 
-    # ------------------------------------------------
-    # 4. PLANNING (LANGGRAPH)
-    # ------------------------------------------------
+    if meter.remaining <= 0:
+        return None, actions, BUDGET_EXCEEDED_ERROR
+
+    started = time.monotonic()
     try:
-        plan = generate_plan(prompt)
+        with stage("planner"):
+            plan = generate_plan(prompt)
         validate_plan(plan)
     except Exception as e:
-        run.output = f"ERROR: Planning failed: {str(e)}"
-        db.commit()
-        return {"error": run.output}
+        return None, actions, f"ERROR: Planning failed: {str(e)}"
 
-    # 🔎 DEBUG — PLANNER OUTPUT
-    print("DEBUG PLAN:", plan)
+    logger.debug("Run %s plan: %s", run_id, plan)
+    emit("plan", {"run_id": run_id, "steps": [s["tool"] for s in plan]})
 
-    db.add(
+    actions.append(
         AgentAction(
-            run_id=run.id,
+            run_id=run_id,
             tool_name="planner",
             tool_input=prompt,
             tool_output=str(plan),
             status="success",
+            created_at=datetime.now(timezone.utc),
+            **span(run_started, started),
         )
     )
-
-    # ------------------------------------------------
-    # 4.5 STORE PLANNER STEPS
-    # ------------------------------------------------
-    planner_steps = []
-
-    for idx, step in enumerate(plan):
-        db_step = PlannerPlan(
-            run_id=run.id,
-            step_index=idx,
-            tool_name=step["tool"],
-            tool_args=step.get("args", {}),
-            status="pending",
+    return plan, actions, None
+
+
+def unplanned_result(run: AgentRun, meter: TokenMeter, error: str) -> dict:
+    """Finish a run whose planning returned an error (caller commits)."""
+    run.output = error
+    _apply_usage(run, meter)
+
+    if error == BUDGET_EXCEEDED_ERROR:
+        run.budget_exceeded = True
+        return _budget_error(run)
+
+    return {"error": run.output}
+
+
+class PlanSteps:
+    """
+    Executes one run's plan on the plan executor.
+
+    start_step / finish_step are the execute_dag callbacks (budget,
+    deadline and permission checks, argument injection, RAG handling);
+    start_fallback / finish_fallback produce the guaranteed answer the
+    same way, and finalize() sets the run output and builds the response
+    (the caller commits). Plan steps and actions are appended to `audit`.
+
+    prefetched maps a tool name to (result or exception, span) computed
+    ahead of time -- the batch path retrieves context for all its runs at
+    once -- and such steps replay it instead of calling the tool.
+    """
+
+    def __init__(
+        self,
+        run: AgentRun,
+        plan: list,
+        prompt: str,
+        user,
+        db,
+        meter: TokenMeter,
+        deadline: Deadline,
+        cancel_event: threading.Event,
+        run_started: float,
+        audit: list,
+        answer_opts: dict,
+        emit=_no_event,
+    ):
+        self.run = run
+        self.prompt = prompt
+        self.user = user
+        self.db = db
+        self.meter = meter
+        self.deadline = deadline
+        self.cancel_event = cancel_event
+        self.run_started = run_started
+        self.audit = audit
+        # Runtime-only options for generate_answer (never logged)
+        self.answer_opts = answer_opts
+        self.emit = emit
+        self.prefetched = {}
+
+        # -------- PLANNER STEPS (WRITTEN WITH THE AUDIT BATCH) --------
+        self.planner_steps = [
+            PlannerPlan(
+                run_id=run.id,
+                step_index=idx,
+                tool_name=step["tool"],
+                tool_args=step.get("args", {}),
+                status="pending",
+            )
+            for idx, step in enumerate(plan)
+        ]
+        audit.extend(self.planner_steps)
+
+        # Independent steps (e.g. get_tasks + retrieve_context) run
+        # concurrently; generate_answer waits for the context it needs.
+        self.deps = build_dependency_graph([s.tool_name for s in self.planner_steps])
+
+        self.context = None
+        self.stopped = None  # (reason, result) once the run must end
+        self.last_index = None
+        self.compression = None
+        self.fallback = None
+        self._fallback_call = {}  # args + start of the fallback answer
+
+        self.step_args = {}
+        self.results = {}
+        self.statuses = {}
+        self.started_at = {}
+        self.finished_at = {}
+        self.spans = {}
+        self.clock = {}  # monotonic start per step
+
+    def stop(self, reason: str, value) -> None:
+        if self.stopped is None:
+            self.stopped = (reason, value)
+
+    def _action(self, tool_name: str, tool_input: str, tool_output: str, status: str, timing: dict) -> None:
+        self.audit.append(
+            AgentAction(
+                run_id=self.run.id,
+                tool_name=tool_name,
+                tool_input=tool_input,
+                tool_output=tool_output,
+                status=status,
+                # Stamped when it happens, not when the audit is written
+                created_at=datetime.now(timezone.utc),
+                **timing,
+            )
         )
-        db.add(db_step)
-        planner_steps.append(db_step)
 
-    db.flush()
+    def _call(self, tool_name: str, tool_fn, args: dict, extra_args: dict):
+        meter = self.meter
 
-    # ------------------------------------------------
-    # 5. EXECUTION LOOP
-    # ------------------------------------------------
-    result = None
-    context = None
+        def call():
+            # Runs sharing one executor (batch) each report to their own meter
+            token = activate_meter(meter)
+            try:
+                with stage(TOOL_STAGES.get(tool_name, "tools")):
+                    return tool_fn(**args, **extra_args)
+            finally:
+                deactivate_meter(token)
 
-    for step in planner_steps:
+        return call
+
+    def start_step(self, i: int):
+        step = self.planner_steps[i]
         tool_name = step.tool_name
         raw_args = step.tool_args
 
-        is_tool_allowed(user, tool_name)
+        if self.cancel_event.is_set():
+            self.stop("error", RUN_CANCELLED_ERROR)
+            return None
+
+        if self.deadline.expired():
+            self.stop("error", RUN_DEADLINE_ERROR)
+            return None
+
+        # -------- BUDGET CHECK (BEFORE EVERY STEP) --------
+        if self.meter.remaining <= 0:
+            self.stop("budget", BUDGET_EXCEEDED_ERROR)
+            return None
+
+        is_tool_allowed(self.user, tool_name)
 
         if tool_name not in TOOLS:
-            result = f"ERROR: Tool '{tool_name}' not registered"
-            break
+            self.stop("error", f"ERROR: Tool '{tool_name}' not registered")
+            return None
 
         tool_fn = TOOLS[tool_name]
 
         # -------- ARG INJECTION --------
         if tool_name == "retrieve_context":
-            args = {"query": prompt, "user_id": user.id}
+            args = {"query": self.prompt, "user_id": self.user.id}
 
         elif tool_name == "generate_answer":
-            args = {"question": prompt, "context": context}
+            context = self.context
+
+            # -------- OPTIONAL EXTRACTIVE COMPRESSION --------
+            if context and CONTEXT_COMPRESSION_ENABLED:
+                started = time.monotonic()
+                context, stats = compress_context(self.prompt, context)
+                self.compression = stats
+                self._action(
+                    "context_compression",
+                    self.prompt,
+                    str(stats),
+                    "success",
+                    span(self.run_started, started),
+                )
+
+            try:
+                fitted_context, max_tokens = fit_answer_to_budget(
+                    self.meter, self.prompt, context
+                )
+            except TokenBudgetExceeded:
+                self.stop("budget", BUDGET_EXCEEDED_ERROR)
+                return None
+            args = {"question": self.prompt, "context": fitted_context, "max_tokens": max_tokens}
 
         elif tool_name == "get_tasks":
-            args = {"db": db, "user_id": user.id}
+            args = {"db": self.db, "user_id": self.user.id}
 
         elif tool_name == "create_task":
             args = {
-                "db": db,
-                "user_id": user.id,
+                "db": self.db,
+                "user_id": self.user.id,
                 "title": raw_args.get("title"),
                 "description": raw_args.get("description"),
             }
         else:
             args = raw_args
 
-        # -------- EXECUTE TOOL --------
-        try:
-            with time_limit(10):
-                result = tool_fn(**args)
-        except ToolTimeout:
-            result = f"ERROR: Tool '{tool_name}' timed out"
-            break
-        except Exception as e:
-            result = f"ERROR: Tool '{tool_name}' failed: {str(e)}"
-            break
+        extra_args = self.answer_opts if tool_name == "generate_answer" else {}
+        self.step_args[i] = args
+
+        # -------- EXECUTE TOOL (ON THE PLAN EXECUTOR) --------
+        self.emit("step_start", {"index": step.step_index, "tool": tool_name})
+        self.started_at[i] = datetime.now(timezone.utc)
+        self.clock[i] = time.monotonic()
+
+        if tool_name in self.prefetched:
+            value = self.prefetched[tool_name][0]
+
+            def replay():
+                if isinstance(value, Exception):
+                    raise value
+                return value
+
+            return replay, None
+
+        call = self._call(tool_name, tool_fn, args, extra_args)
+
+        # 🔒 Session tools share the request session with this thread,
+        # so they are never abandoned (the DB bounds them instead)
+        if tool_name in SESSION_TOOLS:
+            return call, None
+
+        return call, tool_timeout(tool_name)
+
+    def finish_step(self, i: int, result, error) -> bool:
+        step = self.planner_steps[i]
+        tool_name = step.tool_name
+        self.finished_at[i] = datetime.now(timezone.utc)
+        if tool_name in self.prefetched:
+            self.spans[i] = self.prefetched[tool_name][1]
+        else:
+            self.spans[i] = span(self.run_started, self.clock[i])
+        tool_input = str(loggable_args(self.step_args[i]))
+
+        if error is not None:
+            status, message = self._failure(tool_name, error)
+        elif self._client_cancelled():
+            # Returned after the client left: a streamed answer is partial
+            status, message = "cancelled", RUN_CANCELLED_ERROR
+        else:
+            status = None
+
+        if status is not None:
+            self.statuses[i] = status
+            self.emit("step_end", {"index": step.step_index, "tool": tool_name, "status": status})
+            self._action(tool_name, tool_input, message, status, self.spans[i])
+            self.stop("error", message)
+            return True
+
+        self.statuses[i] = "executed"
+        self.results[i] = result
+        self.emit("step_end", {"index": step.step_index, "tool": tool_name, "status": "success"})
+        self._action(tool_name, tool_input, str(result), "success", self.spans[i])
+
+        if self.stopped is not None:
+            return True
+
         if tool_name == "create_task":
-            run.output = str(result)
-            db.commit()
-            return {
-                "result": result,
-                "estimated_tokens_used": run.estimated_tokens_used,
-                "budget_exceeded": run.budget_exceeded,
-            }
+            self.stop("create_task", result)
+            return True
 
         # -------- RAG HANDLING --------
         if tool_name == "retrieve_context":
 
             #  No document exists
             if result is None:
-                run.output = "No document is available to answer this question."
-                db.commit()
-                return {
-                    "result": run.output,
-                    "rag_used": True,
-                }
+                self.stop("no_document", None)
+                return True
 
             # ✅ Document exists ("" or text)
-            context = result
+            self.context = result
+
+        if self.last_index is None or i > self.last_index:
+            self.last_index = i
+
+        return False
+
+    def _client_cancelled(self) -> bool:
+        # Timeouts set cancel_event too, but only after stopping the run
+        return self.cancel_event.is_set() and self.stopped is None
+
+    def _failure(self, tool_name: str, error: Exception) -> tuple:
+        """(status, run output) for a step that raised or timed out."""
+        if isinstance(error, ToolTimeout):
+            # Abort the abandoned work where it listens (streamed answers)
+            self.cancel_event.set()
+            return "timeout", f"ERROR: Tool '{tool_name}' timed out"
+        return "error", f"ERROR: Tool '{tool_name}' failed: {str(error)}"
+
+    def apply_bookkeeping(self, never_started: set) -> None:
+        # The request session is only touched from the calling thread
+        # while no session tool is in flight, so this runs afterwards
+        for i, step in enumerate(self.planner_steps):
+            step.status = "skipped" if i in never_started else self.statuses.get(i, "skipped")
+            step.started_at = self.started_at.get(i)
+            step.finished_at = self.finished_at.get(i)
+            if i in self.spans:
+                step.start_offset_ms = self.spans[i]["start_offset_ms"]
+                step.duration_ms = self.spans[i]["duration_ms"]
+
+    def _plan_result(self):
+        if self.last_index is None:
+            return None
+        return self.results[self.last_index]
+
+    # -------- GUARANTEED FALLBACK (ENGINE-CONTROLLED) --------
+    def needs_fallback(self) -> bool:
+        # 🔒 Document questions NEVER fallback
+        return (
+            self.stopped is None
+            and self._plan_result() is None
+            and not is_rag_allowed(self.prompt)
+        )
 
-        db.add(
-            AgentAction(
-                run_id=run.id,
-                tool_name=tool_name,
-                tool_input=str(args),
-                tool_output=str(result),
-                status="success",
-            )
+    def start_fallback(self, i: int):
+        """execute_dag callback: the fallback answer, bounded like a plan step."""
+        if self.cancel_event.is_set():
+            self.fallback = RUN_CANCELLED_ERROR
+            return None
+
+        try:
+            _, max_tokens = fit_answer_to_budget(self.meter, self.prompt, None)
+        except TokenBudgetExceeded:
+            self.fallback = BUDGET_EXCEEDED_ERROR
+            self.run.budget_exceeded = True
+            return None
+
+        self._fallback_call["args"] = {"question": self.prompt, "context": None, "max_tokens": max_tokens}
+        self._fallback_call["started"] = time.monotonic()
+
+        call = self._call("generate_answer", TOOLS["generate_answer"], self._fallback_call["args"], self.answer_opts)
+        return call, tool_timeout("generate_answer")
+
+    def finish_fallback(self, i: int, result, error) -> bool:
+        if error is not None:
+            status, self.fallback = self._failure("generate_answer", error)
+        elif self._client_cancelled():
+            status, self.fallback = "cancelled", RUN_CANCELLED_ERROR
+        else:
+            status, self.fallback = "success", result
+
+        self._action(
+            "generate_answer",
+            str(self._fallback_call["args"]),
+            str(self.fallback),
+            status,
+            span(self.run_started, self._fallback_call["started"]),
         )
+        return True
 
-    # ------------------------------------------------
-    # 5.5 GUARANTEED FALLBACK (ENGINE-CONTROLLED)
-    # ------------------------------------------------
-    if result is None:
+    # -------- FINALIZE --------
+    def finalize(self) -> dict:
+        run, meter = self.run, self.meter
+        stop_reason, stop_value = self.stopped or (None, None)
 
-        # 🔒 Document questions NEVER fallback
-        if is_rag_allowed(prompt):
+        if stop_reason == "create_task":
+            run.output = str(stop_value)
+            _apply_usage(run, meter)
+            return {
+                "result": stop_value,
+                "estimated_tokens_used": run.estimated_tokens_used,
+                "budget_exceeded": run.budget_exceeded,
+            }
+
+        if stop_reason == "no_document":
+            run.output = "No document is available to answer this question."
+            _apply_usage(run, meter)
+            return {
+                "result": run.output,
+                "rag_used": True,
+            }
+
+        if stop_reason == "budget":
+            run.budget_exceeded = True
+
+        if stop_reason is not None:
+            result = stop_value
+        elif self.fallback is not None:
+            result = self.fallback
+        else:
+            result = self._plan_result()
+
+        if result is None and is_rag_allowed(self.prompt):
             run.output = "The document does not contain information related to this question."
-            db.commit()
+            _apply_usage(run, meter)
             return {
                 "result": run.output,
                 "rag_used": True,
             }
 
-        # ✅ Safe fallback for non-document questions
-        result = TOOLS["generate_answer"](question=prompt, context=None)
+        run.output = str(result)
+        _apply_usage(run, meter)
+
+        if result == BUDGET_EXCEEDED_ERROR:
+            return _budget_error(run)
+
+        if isinstance(result, str) and result.startswith("ERROR"):
+            return {"error": result}
+
+        response = {
+            "result": result,
+            "estimated_tokens_used": run.estimated_tokens_used,
+            "budget_exceeded": run.budget_exceeded,
+        }
+        if self.compression is not None:
+            response["context_compression"] = self.compression
+        return response
+
+
+# ------------------------------------------------
+# MAIN ENTRY
+# ------------------------------------------------
+def run_agent(
+    prompt: str,
+    user,
+    db,
+    on_event=None,
+    cancel_event=None,
+    fresh: bool = False,
+    idempotency_key: str | None = None,
+):
+    """
+    Execute one agent run.
+
+    on_event(event, data) is an optional progress callback used by the
+    streaming endpoint. When it is set, generate_answer streams tokens
+    through it as "token" events. cancel_event (threading.Event) lets the
+    caller abort the run, e.g. when an SSE client disconnects.
+    fresh=True skips the semantic answer cache.
+
+    Concurrent non-streaming calls for the same (user, normalized prompt)
+    -- or the same idempotency key -- are coalesced into a single run.
+    """
+    def execute():
+        return _start_run(
+            prompt, user, db, on_event, cancel_event, fresh, idempotency_key
+        )
+
+    # Streaming callers each need their own event feed
+    if on_event is not None:
+        return execute()
+
+    if idempotency_key:
+        # A different prompt under the same key is not coalesced: its
+        # run hits the key's unique index and gets a 422
+        key = (user.id, "idempotency", idempotency_key, prompt)
+    else:
+        key = (user.id, "prompt", normalize_prompt(prompt))
+
+    return _in_flight_runs.do(key, execute, wait_timeout=RUN_DEADLINE_SECONDS)
+
+
+def _start_run(prompt, user, db, on_event, cancel_event, fresh, idempotency_key):
+    # Every LLM call made during the run reports its usage to this meter
+    meter = TokenMeter(MAX_TOKENS_PER_RUN)
+    meter_token = activate_meter(meter)
+
+    # Hard ceiling on wall-clock time for the whole run
+    deadline = Deadline(RUN_DEADLINE_SECONDS)
+    deadline_token = activate_deadline(deadline)
+
+    # Internal abort signal (also set when a step times out)
+    cancel_event = cancel_event or threading.Event()
+
+    # Audit rows (actions + plan steps) are written behind the response,
+    # once the run row they reference has been committed
+    audit = []
+    # Set by _run_agent once the run row is created
+    run_ref = {"run": None}
+
+    AGENT_RUNS_IN_FLIGHT.inc()
+    try:
+        try:
+            result = _run_agent(
+                prompt, user, db, meter, deadline, on_event, cancel_event, fresh,
+                idempotency_key, audit, run_ref,
+            )
+        except Exception as e:
+            run = run_ref["run"]
+            # Failed runs count in the usage rollups and keep their audit rows
+            if run is not None and _record_failed_run(db, run, meter, e):
+                audit.append(
+                    RunUsage(
+                        user_id=user.id,
+                        tokens_used=meter.used,
+                        failed=True,
+                        budget_exceeded=bool(run.budget_exceeded),
+                    )
+                )
+                audit_writer.submit(audit)
+            raise
+        # Audit rows exist only once the run row does (not for runs
+        # refused before that, e.g. rate limited)
+        if audit:
+            audit.append(
+                RunUsage(
+                    user_id=user.id,
+                    tokens_used=meter.used,
+                    failed="error" in result,
+                    budget_exceeded=bool(result.get("budget_exceeded") or meter.exceeded),
+                )
+            )
+        audit_writer.submit(audit)
+        return result
+    finally:
+        AGENT_RUNS_IN_FLIGHT.dec()
+        deactivate_deadline(deadline_token)
+        deactivate_meter(meter_token)
+
+
+def _run_agent(
+    prompt: str,
+    user,
+    db,
+    meter: TokenMeter,
+    deadline: Deadline,
+    on_event,
+    cancel_event: threading.Event,
+    fresh: bool,
+    idempotency_key: str | None,
+    audit: list,
+    run_ref: dict,
+):
+    emit = on_event or _no_event
+
+    # Every stage is timed against this (monotonic) origin
+    run_started = time.monotonic()
+
+    def on_token(text: str) -> None:
+        emit("token", {"text": text})
+
+    # Runtime-only options for generate_answer (never logged)
+    answer_opts = {"fresh": fresh, "cancel_event": cancel_event, "user_id": user.id}
+    if on_event is not None:
+        answer_opts["on_token"] = on_token
 
     # ------------------------------------------------
-    # 6. FINALIZE
+    # 0. OPS KILL SWITCH
     # ------------------------------------------------
-    run.output = str(result)
-    db.commit()
+    if os.getenv("AGENT_ENABLED", "true").lower() != "true":
+        return {"error": "Agent disabled by ops"}
 
-    if isinstance(result, str) and result.startswith("ERROR"):
-        return {"error": result}
+    # ------------------------------------------------
+    # 0.5 HARD INPUT LIMIT
+    # ------------------------------------------------
+    if len(prompt) > MAX_PROMPT_CHARS:
+        return prompt_too_long_error()
 
-    return {
-        "result": result,
-        "estimated_tokens_used": run.estimated_tokens_used,
-        "budget_exceeded": run.budget_exceeded,
-    }
+    # ------------------------------------------------
+    # 1. RATE LIMIT
+    # ------------------------------------------------
+    try:
+        with stage("rate_limit"):
+            enforce_run_limit(user)
+    except AgentRateLimitError as e:
+        return {"error": str(e), "status": 429, "retry_after": e.quota.retry_after}
+
+    # ------------------------------------------------
+    # 2. CREATE AGENT RUN
+    # ------------------------------------------------
+    run = AgentRun(
+        user_id=user.id,
+        input=prompt,
+        estimated_tokens_used=0,
+        budget_exceeded=False,
+        idempotency_key=idempotency_key,
+    )
+    db.add(run)
+    db.flush()
+    run_ref["run"] = run
+
+    # Make the key visible to other workers while the run is in progress
+    if idempotency_key:
+        db.commit()
+
+    # ------------------------------------------------
+    # 3-4. INTENT CLASSIFIER + PLANNING (LANGGRAPH)
+    # ------------------------------------------------
+    plan, actions, error = plan_prompt(prompt, run.id, meter, run_started, emit)
+    audit.extend(actions)
+    if error is not None:
+        response = unplanned_result(run, meter, error)
+        db.commit()
+        return response
+
+    # ------------------------------------------------
+    # 5. EXECUTION (DEPENDENCY GRAPH)
+    # ------------------------------------------------
+    steps = PlanSteps(
+        run, plan, prompt, user, db, meter, deadline, cancel_event,
+        run_started, audit, answer_opts, emit,
+    )
+
+    never_started = set()
+    try:
+        never_started = execute_dag(
+            steps.deps, steps.start_step, steps.finish_step, max_workers=PLAN_MAX_WORKERS
+        )
+    finally:
+        # Also when a step was refused (403): what ran stays audited
+        steps.apply_bookkeeping(never_started)
+
+    # ------------------------------------------------
+    # 5.5 GUARANTEED FALLBACK (ENGINE-CONTROLLED)
+    # ------------------------------------------------
+    if steps.needs_fallback():
+        execute_dag({0: set()}, steps.start_fallback, steps.finish_fallback)
+
+    # ------------------------------------------------
+    # 6. FINALIZE
+    # ------------------------------------------------
+    response = steps.finalize()
+    db.commit()
+    return response
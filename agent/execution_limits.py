@@ -1,31 +1,260 @@
-from datetime import datetime, timedelta
+# agent/execution_limits.py
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+
 from sqlalchemy.orm import Session
+
 from models.agent_run import AgentRun
+from core import metrics
 
 
 class AgentRateLimitError(Exception):
     """Raised when an agent exceeds allowed execution limits"""
-    pass
 
+    def __init__(self, message: str, quota=None):
+        super().__init__(message)
+        self.quota = quota
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+MAX_RUNS = int(os.getenv("AGENT_MAX_RUNS", "20"))
+WINDOW_MINUTES = int(os.getenv("AGENT_RATE_WINDOW_MINUTES", "10"))
+
+# Per-role overrides, e.g. "admin=200,service=1000"; other roles get MAX_RUNS
+ROLE_MAX_RUNS = {
+    role.strip(): int(limit)
+    for role, _, limit in (
+        part.partition("=")
+        for part in os.getenv("AGENT_ROLE_MAX_RUNS", "").split(",")
+        if "=" in part
+    )
+}
+
+# memory: per process. sqlite: a local file shared by every worker on the host
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "rate_limit.db")
+
+RATE_LIMITED = metrics.counter(
+    "agent_rate_limited_total",
+    "Agent requests rejected by the run limiter",
+    ("role",),
+)
+
+
+def limit_for(role: str | None) -> int:
+    return ROLE_MAX_RUNS.get(role or "user", MAX_RUNS)
+
+
+class Quota:
+    """Outcome of one limiter check, as reported to the client."""
+
+    def __init__(self, limit: int, remaining: int, reset_after: float, allowed: bool):
+        self.limit = limit
+        self.remaining = remaining
+        # Seconds until the oldest run in the window expires
+        self.reset_after = reset_after
+        self.allowed = allowed
+
+    @property
+    def retry_after(self) -> int | None:
+        return None if self.allowed else max(1, math.ceil(self.reset_after))
+
+    def headers(self) -> dict:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+# ------------------------------------------------
+# SLIDING WINDOW STORES
+# ------------------------------------------------
+class MemoryWindow:
+    """Admitted run timestamps per user, in process memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = {}
+
+    def acquire(self, user_id: int, runs: int, limit: int, now: float, window: float) -> tuple:
+        """Returns (allowed, used, oldest timestamp in the window or None)."""
+        cutoff = now - window
+        with self._lock:
+            hits = self._hits.setdefault(user_id, deque())
+            while hits and hits[0] <= cutoff:
+                hits.popleft()
+
+            allowed = len(hits) + runs <= limit
+            if allowed:
+                hits.extend([now] * runs)
+            return allowed, len(hits), hits[0] if hits else None
 
-MAX_RUNS = 20
-WINDOW_MINUTES = 10
+    def seed(self, hits_by_user: dict, cutoff: float) -> bool:
+        """Start this process from the runs in the window; returns True."""
+        with self._lock:
+            self._hits = {
+                user_id: deque(sorted(stamps))
+                for user_id, stamps in hits_by_user.items()
+            }
+        return True
 
 
-def enforce_run_limit(db: Session, user_id: int):
+class SqliteWindow:
+    """
+    Same window kept in a local SQLite file, so several worker processes
+    on one host share a single quota. Each check is one short
+    BEGIN IMMEDIATE transaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_hits (user_id INTEGER NOT NULL, ts REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_rate_hits_user_ts ON rate_hits (user_id, ts)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, user_id: int, runs: int, limit: int, now: float, window: float) -> tuple:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM rate_hits WHERE user_id = ? AND ts <= ?",
+                (user_id, now - window),
+            )
+            used, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(ts) FROM rate_hits WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+
+            allowed = used + runs <= limit
+            if allowed:
+                conn.executemany(
+                    "INSERT INTO rate_hits (user_id, ts) VALUES (?, ?)",
+                    [(user_id, now)] * runs,
+                )
+                used += runs
+                oldest = now if oldest is None else oldest
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, used, oldest
+
+    def seed(self, hits_by_user: dict, cutoff: float) -> bool:
+        """
+        Load the runs in the window, unless the file already holds hits
+        newer than cutoff: then other workers are live and the file is
+        the quota (it is shared, so it is never reset). Returns whether
+        the hits were loaded.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            live = conn.execute(
+                "SELECT 1 FROM rate_hits WHERE ts > ? LIMIT 1", (cutoff,)
+            ).fetchone()
+            if live is None:
+                conn.execute("DELETE FROM rate_hits")
+                conn.executemany(
+                    "INSERT INTO rate_hits (user_id, ts) VALUES (?, ?)",
+                    [(u, ts) for u, stamps in hits_by_user.items() for ts in stamps],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return live is None
+
+
+def _build_window():
+    if RATE_LIMIT_STORE == "memory":
+        return MemoryWindow()
+    if RATE_LIMIT_STORE == "sqlite":
+        return SqliteWindow(RATE_LIMIT_SQLITE_PATH)
+    raise ValueError(f"Unknown RATE_LIMIT_STORE: {RATE_LIMIT_STORE!r}")
+
+
+_window = _build_window()
+
+# Quota of the last check on this request, for the response headers
+_current_quota: ContextVar = ContextVar("run_quota", default=None)
+
+
+def current_quota() -> Quota | None:
+    return _current_quota.get()
+
+
+# ------------------------------------------------
+# PUBLIC API
+# ------------------------------------------------
+def seed_run_limits(db: Session) -> int:
+    """
+    Load runs from the current window so a restart does not hand out a
+    fresh quota. Called once on startup by every worker; a shared store
+    that other workers are already using is left as is. Returns the
+    number of runs loaded.
+    """
     cutoff = datetime.utcnow() - timedelta(minutes=WINDOW_MINUTES)
 
-    count = (
-        db.query(AgentRun)
-        .filter(
-            AgentRun.user_id == user_id,
-            AgentRun.created_at >= cutoff,
-        )
-        .count()
+    rows = (
+        db.query(AgentRun.user_id, AgentRun.created_at)
+        .filter(AgentRun.created_at >= cutoff)
+        .all()
     )
 
-    if count >= MAX_RUNS:
+    hits = {}
+    for user_id, created_at in rows:
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        hits.setdefault(user_id, []).append(created_at.timestamp())
+
+    if not _window.seed(hits, cutoff.replace(tzinfo=timezone.utc).timestamp()):
+        return 0
+    return len(rows)
+
+
+def enforce_run_limit(user, runs: int = 1) -> Quota:
+    limit = limit_for(getattr(user, "role", None))
+    window = WINDOW_MINUTES * 60
+    now = time.time()
+
+    allowed, used, oldest = _window.acquire(user.id, runs, limit, now, window)
+
+    reset_after = max(0.0, oldest + window - now) if oldest is not None else 0.0
+    quota = Quota(limit, max(0, limit - used), reset_after, allowed)
+    _current_quota.set(quota)
+
+    if not allowed:
+        RATE_LIMITED.inc(role=getattr(user, "role", None) or "user")
         raise AgentRateLimitError(
-            "Agent rate limit exceeded. Please wait before making more requests."
+            "Agent rate limit exceeded. Please wait before making more requests.",
+            quota,
         )
 
+    return quota
@@ -1,9 +1,7 @@
 # agent/intent_classifier.py
 
 import json
-from groq import Groq
-
-client = Groq()  # uses GROQ_API_KEY from env
+from agent.llm_client import chat_completion
 
 SYSTEM_PROMPT = """
 You are an intent classifier.
@@ -36,8 +34,8 @@ VALID_INTENTS = {"CREATE_TASK", "LIST_TASKS", "ASK_DOC", "ANSWER"}
 
 def classify_intent(user_input: str) -> dict:
     try:
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        response = chat_completion(
+            "intent_classifier",
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_input},
@@ -2,11 +2,9 @@
 
 from typing import TypedDict, List
 from langgraph.graph import StateGraph, END
-from groq import Groq
+from agent.llm_client import chat_completion
 import json
 
-client = Groq()
-
 # -----------------------------
 # State
 # -----------------------------
@@ -126,8 +124,8 @@ def plan_with_llm(state: PlannerState) -> PlannerState:
     raw_plan = []
 
     try:
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        response = chat_completion(
+            "planner",
             temperature=0,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
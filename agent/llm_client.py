@@ -0,0 +1,298 @@
+# agent/llm_client.py
+
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import httpx
+from groq import Groq, APIStatusError, APIConnectionError
+
+from agent.token_budget import AVG_TOKENS_PER_CHAR, estimate_messages_tokens, record_usage
+from agent.tool_timeout import bounded_timeout, remaining_run_time
+from core.metrics import LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_RETRIES, LLM_TOKENS
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+
+# groq → api.groq.com (or LLM_BASE_URL)
+# stub → local OpenAI/Groq-compatible stub server (bench/llm_stub.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+LLM_STUB_URL = os.getenv("LLM_STUB_URL", "http://127.0.0.1:8900")
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = 0.5
+LLM_BACKOFF_MAX_SECONDS = 8.0
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+# ------------------------------------------------
+# SHARED CLIENT (ONE POOL FOR THE WHOLE PROCESS)
+# ------------------------------------------------
+_http_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+    ),
+    timeout=LLM_TIMEOUT_SECONDS,
+)
+
+
+def _build_client() -> Groq:
+    # Retries are handled here (with jitter + retry-after), not by the SDK
+    if LLM_BACKEND == "groq":
+        # uses GROQ_API_KEY from env
+        return Groq(base_url=LLM_BASE_URL, http_client=_http_client, max_retries=0)
+
+    if LLM_BACKEND == "stub":
+        return Groq(
+            base_url=LLM_BASE_URL or LLM_STUB_URL,
+            api_key="stub",
+            http_client=_http_client,
+            max_retries=0,
+        )
+
+    raise ValueError(f"Unknown LLM_BACKEND '{LLM_BACKEND}' (expected groq or stub)")
+
+
+client = _build_client()
+
+# Global cap on in-flight LLM calls across all callers
+_semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+
+# ------------------------------------------------
+# METRICS (PER CALL SITE)
+# ------------------------------------------------
+_metrics_lock = threading.Lock()
+_metrics = defaultdict(
+    lambda: {
+        "calls": 0,
+        "errors": 0,
+        "retries": 0,
+        "total_latency_ms": 0.0,
+        "max_latency_ms": 0.0,
+    }
+)
+
+
+def _record(call_site: str, started: float, error: bool, retries: int) -> None:
+    latency_ms = (time.monotonic() - started) * 1000
+
+    LLM_REQUEST_SECONDS.observe(latency_ms / 1000, call_site=call_site)
+    LLM_REQUESTS.inc(call_site=call_site, outcome="error" if error else "success")
+    if retries:
+        LLM_RETRIES.inc(retries, call_site=call_site)
+    with _metrics_lock:
+        m = _metrics[call_site]
+        m["calls"] += 1
+        m["retries"] += retries
+        m["total_latency_ms"] += latency_ms
+        m["max_latency_ms"] = max(m["max_latency_ms"], latency_ms)
+        if error:
+            m["errors"] += 1
+
+
+def _record_tokens(call_site: str, usage) -> None:
+    if usage is None:
+        return
+    record_usage(usage)
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, call_site=call_site, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, call_site=call_site, kind="completion")
+
+
+def get_llm_metrics() -> dict:
+    with _metrics_lock:
+        return {
+            site: {
+                "calls": m["calls"],
+                "errors": m["errors"],
+                "retries": m["retries"],
+                "avg_latency_ms": round(m["total_latency_ms"] / m["calls"], 2)
+                if m["calls"]
+                else 0.0,
+                "max_latency_ms": round(m["max_latency_ms"], 2),
+            }
+            for site, m in _metrics.items()
+        }
+
+
+# ------------------------------------------------
+# RETRY POLICY
+# ------------------------------------------------
+def _retry_after_seconds(error: APIStatusError) -> float | None:
+    headers = error.response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    return None
+
+
+def _retry_delay(error: Exception, attempt: int) -> float | None:
+    """
+    Seconds to wait before the next attempt, or None if not retryable.
+    """
+    if isinstance(error, APIStatusError):
+        if error.status_code not in RETRYABLE_STATUS:
+            return None
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, LLM_BACKOFF_MAX_SECONDS) + random.uniform(0, 0.1)
+
+    elif not isinstance(error, APIConnectionError):
+        # Covers timeouts too (APITimeoutError is a connection error)
+        return None
+
+    # Full jitter exponential backoff
+    cap = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def _create(call_site: str, request: dict, timeout: float, hold_slot: bool = False):
+    started = time.monotonic()
+    attempt = 0
+
+    while True:
+        # Each attempt is also capped by the agent run deadline
+        try:
+            request["timeout"] = bounded_timeout(timeout)
+        except Exception:
+            _record(call_site, started, error=True, retries=attempt)
+            raise
+
+        _semaphore.acquire()
+        try:
+            response = client.chat.completions.create(
+                **request,
+                # Lets the stub server answer per call site; ignored by Groq
+                extra_headers={"X-LLM-Call-Site": call_site},
+            )
+        except Exception as e:
+            # 🔒 Never sleep while holding a concurrency slot
+            _semaphore.release()
+            delay = _retry_delay(e, attempt)
+            remaining = remaining_run_time()
+            if (
+                delay is None
+                or attempt >= LLM_MAX_RETRIES
+                or (remaining is not None and delay >= remaining)
+            ):
+                _record(call_site, started, error=True, retries=attempt)
+                raise
+            attempt += 1
+            time.sleep(delay)
+            continue
+
+        if not hold_slot:
+            _semaphore.release()
+        _record(call_site, started, error=False, retries=attempt)
+        return response
+
+
+# ------------------------------------------------
+# PUBLIC API
+# ------------------------------------------------
+def chat_completion(
+    call_site: str,
+    messages: list,
+    model: str = DEFAULT_MODEL,
+    timeout: float | None = None,
+    **kwargs,
+):
+    request = {
+        "model": model,
+        "messages": messages,
+        **kwargs,
+    }
+    response = _create(call_site, request, timeout or LLM_TIMEOUT_SECONDS)
+    _record_tokens(call_site, getattr(response, "usage", None))
+    return response
+
+
+def _chunk_usage(chunk):
+    # Groq reports usage on the last chunk under x_groq,
+    # OpenAI-compatible servers under chunk.usage
+    x_groq = getattr(chunk, "x_groq", None)
+    return getattr(x_groq, "usage", None) or getattr(chunk, "usage", None)
+
+
+class _StreamTally:
+    def __init__(self):
+        self.usage_seen = False
+        self.completion_chars = 0
+        # Attribute names match the SDK usage object (see record_usage)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+def _iter_with_usage(call_site: str, stream, tally: _StreamTally):
+    for chunk in stream:
+        usage = _chunk_usage(chunk)
+        if usage is not None:
+            _record_tokens(call_site, usage)
+            tally.usage_seen = True
+
+        if chunk.choices:
+            tally.completion_chars += len(chunk.choices[0].delta.content or "")
+
+        yield chunk
+
+
+@contextmanager
+def stream_chat_completion(
+    call_site: str,
+    messages: list,
+    model: str = DEFAULT_MODEL,
+    timeout: float | None = None,
+    **kwargs,
+):
+    """
+    Streaming variant. The concurrency slot is held until the
+    stream is exhausted or closed.
+    """
+    request = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        **kwargs,
+    }
+    stream = _create(call_site, request, timeout or LLM_TIMEOUT_SECONDS, hold_slot=True)
+    tally = _StreamTally()
+    try:
+        yield _iter_with_usage(call_site, stream, tally)
+    finally:
+        # Stream cancelled before the usage chunk: fall back to an estimate
+        if not tally.usage_seen:
+            tally.prompt_tokens = estimate_messages_tokens(messages)
+            tally.completion_tokens = int(tally.completion_chars * AVG_TOKENS_PER_CHAR)
+            _record_tokens(call_site, tally)
+        try:
+            stream.close()
+        finally:
+            _semaphore.release()
@@ -0,0 +1,192 @@
+# agent/payloads.py
+
+import hashlib
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, exists, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.payload_blob import PayloadBlob
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+# Payloads above this many UTF-8 bytes are stored as blobs
+PAYLOAD_INLINE_MAX_BYTES = int(os.getenv("PAYLOAD_INLINE_MAX_BYTES", "1024"))
+PAYLOAD_COMPRESSION_LEVEL = int(os.getenv("PAYLOAD_COMPRESSION_LEVEL", "6"))
+# Blobs written or reused more recently than this are never swept, even
+# if no committed action references them yet
+PAYLOAD_ORPHAN_GRACE_SECONDS = int(os.getenv("PAYLOAD_ORPHAN_GRACE_SECONDS", "3600"))
+
+# (inline column, blob reference column) on AgentAction
+PAYLOAD_FIELDS = (
+    ("tool_input", "tool_input_blob"),
+    ("tool_output", "tool_output_blob"),
+)
+
+
+def loggable_args(args: dict) -> dict:
+    """Tool args as they should be audited (the injected DB session is not data)."""
+    return {k: v for k, v in args.items() if not isinstance(v, Session)}
+
+
+# ------------------------------------------------
+# WRITE SIDE (AUDIT WRITER)
+# ------------------------------------------------
+def externalize_payloads(rows: list) -> list:
+    """
+    Move large tool_input/tool_output values of AgentAction row dicts
+    into blobs (in place). Returns the blob rows to insert, one per
+    distinct content.
+    """
+    blobs = {}
+
+    for row in rows:
+        for field, ref in PAYLOAD_FIELDS:
+            text = row.get(field)
+            if text is None:
+                continue
+
+            raw = text.encode("utf-8")
+            if len(raw) <= PAYLOAD_INLINE_MAX_BYTES:
+                continue
+
+            digest = hashlib.sha256(raw).hexdigest()
+            if digest not in blobs:
+                blobs[digest] = {
+                    "sha256": digest,
+                    "data": zlib.compress(raw, PAYLOAD_COMPRESSION_LEVEL),
+                    "size": len(raw),
+                }
+
+            del row[field]
+            row[ref] = digest
+
+    return list(blobs.values())
+
+
+def save_blobs(db: Session, blobs: list) -> None:
+    """
+    Insert blobs that are not stored yet (identical content is shared)
+    and mark existing ones as used. The touch runs in the same
+    transaction as the actions that reference the blob: a concurrent
+    delete_orphan_blobs either removes the blob first (and it is
+    inserted again) or sees the fresh last_used_at and keeps it.
+    """
+    if not blobs:
+        return
+
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+        stmt = dialect_insert(PayloadBlob)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["sha256"],
+                set_={"last_used_at": func.now()},
+            ),
+            # Sorted keys: concurrent writers lock rows in the same order
+            sorted(blobs, key=lambda b: b["sha256"]),
+        )
+        return
+
+    existing = set(
+        db.scalars(
+            select(PayloadBlob.sha256).where(
+                PayloadBlob.sha256.in_([b["sha256"] for b in blobs])
+            )
+        )
+    )
+    if existing:
+        db.execute(
+            update(PayloadBlob)
+            .where(PayloadBlob.sha256.in_(existing))
+            .values(last_used_at=func.now())
+        )
+    missing = [b for b in blobs if b["sha256"] not in existing]
+    if missing:
+        db.execute(insert(PayloadBlob), missing)
+
+
+# ------------------------------------------------
+# READ SIDE (ADMIN)
+# ------------------------------------------------
+def load_payloads(db: Session, actions: list) -> dict:
+    """{sha256: text} for every blob referenced by the given actions (one query)."""
+    digests = {
+        getattr(action, ref)
+        for action in actions
+        for _, ref in PAYLOAD_FIELDS
+        if getattr(action, ref)
+    }
+    if not digests:
+        return {}
+
+    blobs = db.query(PayloadBlob).filter(PayloadBlob.sha256.in_(digests)).all()
+    return {b.sha256: zlib.decompress(b.data).decode("utf-8") for b in blobs}
+
+
+def payload(action, field: str, blobs: dict) -> str | None:
+    """tool_input / tool_output of an action, inline or from its blob."""
+    value = getattr(action, field)
+    if value is not None:
+        return value
+    digest = getattr(action, f"{field}_blob")
+    return blobs.get(digest) if digest else None
+
+
+def delete_orphan_blobs(
+    db: Session,
+    limit: int | None = None,
+    grace_seconds: int = PAYLOAD_ORPHAN_GRACE_SECONDS,
+    after: str = "",
+) -> tuple:
+    """
+    Delete blobs no longer referenced by any action, scanning at most
+    limit blobs in sha256 order after `after` (keyset). Each candidate
+    costs two probes of the blob reference indexes, so a batch is
+    bounded whatever the size of agent_actions.
+
+    Blobs used within grace_seconds are kept: the audit writer may be
+    about to commit actions that reference them.
+
+    Returns (deleted, sha256 to continue after or None once the scan is done).
+    """
+    from models.agent_action import AgentAction
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+
+    scan = (
+        select(PayloadBlob.sha256)
+        .where(PayloadBlob.sha256 > after, PayloadBlob.last_used_at < cutoff)
+        .order_by(PayloadBlob.sha256)
+    )
+    if limit is not None:
+        scan = scan.limit(limit)
+    candidates = db.scalars(scan).all()
+    if not candidates:
+        return 0, None
+
+    deleted = db.execute(
+        delete(PayloadBlob)
+        .where(
+            PayloadBlob.sha256.in_(candidates),
+            # Checked again here: a concurrent save_blobs may have reused it
+            PayloadBlob.last_used_at < cutoff,
+            ~exists().where(AgentAction.tool_input_blob == PayloadBlob.sha256),
+            ~exists().where(AgentAction.tool_output_blob == PayloadBlob.sha256),
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    if limit is None or len(candidates) < limit:
+        return deleted, None
+    return deleted, candidates[-1]
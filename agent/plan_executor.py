@@ -0,0 +1,242 @@
+# agent/plan_executor.py
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from core import metrics
+from agent.tool_timeout import ToolTimeout, remaining_run_time
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+# Steps of one run in flight at once
+PLAN_MAX_WORKERS = int(os.getenv("PLAN_MAX_WORKERS", "4"))
+# Requests served at once: sync endpoints run on the server threadpool
+# (40 threads by default in Starlette/AnyIO)
+REQUEST_THREADS = int(os.getenv("REQUEST_THREADS", "40"))
+# Every concurrent run can have all its steps in flight without queueing
+PLAN_POOL_SIZE = int(
+    os.getenv("PLAN_POOL_SIZE", str(REQUEST_THREADS * PLAN_MAX_WORKERS))
+)
+
+# Shared pool for plan steps of all runs; threads are started lazily.
+# Timed-out steps are abandoned here (Python threads cannot be killed);
+# the LLM client caps its own HTTP timeouts by the run deadline so
+# abandoned LLM calls are cut off upstream as well.
+_executor = ThreadPoolExecutor(
+    max_workers=PLAN_POOL_SIZE,
+    thread_name_prefix="plan-step",
+)
+
+# How often a run re-checks steps still queued for a pool thread
+QUEUE_POLL_SECONDS = 0.05
+
+# start_step result for a step that is left out while scheduling goes on
+SKIP = object()
+
+PLAN_STEPS_ABANDONED = metrics.counter(
+    "plan_steps_abandoned_total",
+    "Plan steps abandoned after their timeout while still running",
+)
+PLAN_STEPS_ABANDONED_RUNNING = metrics.gauge(
+    "plan_steps_abandoned_running",
+    "Abandoned plan steps still holding a pool thread",
+)
+
+
+# ------------------------------------------------
+# DEPENDENCY RULES (MIRROR ENGINE ARG INJECTION)
+# ------------------------------------------------
+# generate_answer receives the context produced by retrieve_context
+DATA_DEPENDENCIES = {
+    "generate_answer": {"retrieve_context"},
+}
+
+# Tools injected with the request DB session.
+# A Session is not thread-safe, so these never overlap.
+SESSION_TOOLS = {"get_tasks", "create_task"}
+
+# Tools whose result ends the run: nothing after them may start first
+TERMINAL_TOOLS = {"create_task"}
+
+
+def build_dependency_graph(tool_names: list) -> dict:
+    """
+    Returns {step_index: set(step indexes it must wait for)}.
+    Dependencies only point backwards, so plan order is preserved
+    wherever it matters and the graph is always acyclic.
+    """
+    deps = {i: set() for i in range(len(tool_names))}
+
+    for i, tool in enumerate(tool_names):
+        for j in range(i):
+            prev = tool_names[j]
+
+            if prev in DATA_DEPENDENCIES.get(tool, set()):
+                deps[i].add(j)
+
+            if tool in SESSION_TOOLS and prev in SESSION_TOOLS:
+                deps[i].add(j)
+
+            if prev in TERMINAL_TOOLS:
+                deps[i].add(j)
+
+    return deps
+
+
+# ------------------------------------------------
+# EXECUTION
+# ------------------------------------------------
+class _TimedStep:
+    """
+    Step callable with a timeout that starts when a pool thread picks it
+    up, so time spent queued does not count against the tool. Once
+    abandoned it is tracked in PLAN_STEPS_ABANDONED_RUNNING until its
+    thread is free again.
+    """
+
+    def __init__(self, fn, timeout: float):
+        self.fn = fn
+        self.timeout = timeout
+        self.started = None  # monotonic, set on the pool thread
+        self._finished = False
+        self._abandoned = False
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        self.started = time.monotonic()
+        try:
+            return self.fn()
+        finally:
+            with self._lock:
+                self._finished = True
+                if self._abandoned:
+                    PLAN_STEPS_ABANDONED_RUNNING.dec()
+
+    def expires_at(self, run_expires: float | None) -> float | None:
+        # Still queued: only the run deadline applies
+        if self.started is None:
+            return run_expires
+        expires = self.started + self.timeout
+        return expires if run_expires is None else min(expires, run_expires)
+
+    def expired(self, run_expires: float | None, now: float) -> bool:
+        expires = self.expires_at(run_expires)
+        return expires is not None and expires <= now
+
+    def abandon(self) -> None:
+        with self._lock:
+            if self._finished or self._abandoned:
+                return
+            self._abandoned = True
+        PLAN_STEPS_ABANDONED.inc()
+        PLAN_STEPS_ABANDONED_RUNNING.inc()
+
+
+def _wait_timeout(timed: dict, run_expires: float | None, now: float) -> float | None:
+    timeouts = []
+    for step in timed.values():
+        expires = step.expires_at(run_expires)
+        if expires is not None:
+            timeouts.append(expires - now)
+        if step.started is None:
+            timeouts.append(QUEUE_POLL_SECONDS)
+    return max(min(timeouts), 0) if timeouts else None
+
+
+def execute_dag(deps: dict, start_step, finish_step, max_workers: int = PLAN_MAX_WORKERS) -> set:
+    """
+    Run steps as soon as their dependencies have finished, at most
+    max_workers of them at once for this run.
+
+    start_step(i) runs on the calling thread and returns
+    (callable, timeout_seconds) to execute on the pool, SKIP to leave the
+    step out (its dependents may still run), or None to stop scheduling.
+    A timeout of None means the step is never abandoned;
+    otherwise it counts from the moment the step starts running, capped
+    by the run deadline.
+    finish_step(i, result, error) runs on the calling thread for every
+    started step (error is ToolTimeout when it ran out of time) and
+    returns True to stop scheduling new steps.
+
+    Returns the indexes of steps that were never started.
+    """
+    pending = set(deps)
+    done = set()
+    running = {}
+    timed = {}  # future -> _TimedStep
+    stopped = False
+
+    remaining = remaining_run_time()
+    run_expires = None if remaining is None else time.monotonic() + remaining
+
+    while True:
+        ready = True
+        while ready and not stopped:
+            ready = False
+            for i in sorted(i for i in pending if deps[i] <= done):
+                if len(running) >= max_workers:
+                    break
+
+                pending.discard(i)
+                try:
+                    scheduled = start_step(i)
+                except BaseException:
+                    # e.g. permission denied: let non-abandonable steps settle first
+                    wait([f for f in running if f not in timed])
+                    raise
+
+                if scheduled is None:
+                    stopped = True
+                    break
+
+                if scheduled is SKIP:
+                    # Settled without running: look again for what it unblocked
+                    done.add(i)
+                    ready = True
+                    continue
+
+                fn, timeout = scheduled
+                if timeout is not None:
+                    fn = _TimedStep(fn, timeout)
+
+                # Context vars (e.g. the run's token meter) follow the step
+                ctx = contextvars.copy_context()
+                future = _executor.submit(ctx.run, fn)
+                running[future] = i
+                if timeout is not None:
+                    timed[future] = fn
+
+        if not running:
+            break
+
+        wait_for = _wait_timeout(timed, run_expires, time.monotonic())
+        finished, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in sorted(finished, key=running.get):
+            i = running.pop(future)
+            timed.pop(future, None)
+            error = future.exception()
+            result = None if error else future.result()
+            done.add(i)
+
+            if finish_step(i, result, error):
+                stopped = True
+
+        # -------- ABANDON STEPS PAST THEIR DEADLINE --------
+        now = time.monotonic()
+        for future in [f for f, step in timed.items() if step.expired(run_expires, now)]:
+            i = running.pop(future)
+            step = timed.pop(future)
+            # cancel() only succeeds if it never started
+            if not future.cancel():
+                step.abandon()
+
+            if finish_step(i, None, ToolTimeout()):
+                stopped = True
+
+    return pending
@@ -0,0 +1,291 @@
+# agent/retention.py
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from db.database import SessionLocal
+from core import metrics
+from agent.payloads import delete_orphan_blobs
+from models.agent_run import AgentRun
+from models.agent_action import AgentAction
+from models.planner_plan import PlannerPlan
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+# At least a day, so runs still in flight are never expired
+RETENTION_DAYS = max(int(os.getenv("RETENTION_DAYS", "7")), 1)
+# Runs (with their actions and plans) deleted per transaction
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+# Pause between batches so other writers get the table
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.1"))
+# Scheduled sweep; 0 disables it (on-demand jobs still run)
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+# Finished jobs kept for GET /admin/retention-jobs
+RETENTION_JOB_HISTORY = int(os.getenv("RETENTION_JOB_HISTORY", "50"))
+
+RETENTION_ROWS_DELETED = metrics.counter(
+    "retention_rows_deleted_total",
+    "Rows deleted by the retention job",
+    ("table",),
+)
+RETENTION_JOBS = metrics.counter(
+    "retention_jobs_total",
+    "Finished retention jobs",
+    ("status",),
+)
+
+TABLES = ("agent_runs", "agent_actions", "planner_plans", "payload_blobs")
+
+
+class RetentionJob:
+    def __init__(self, older_than_days: int, trigger: str):
+        self.id = uuid.uuid4().hex
+        self.older_than_days = older_than_days
+        self.trigger = trigger  # manual | schedule
+        self.status = "queued"  # queued | running | succeeded | failed | cancelled
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at = None
+        self.finished_at = None
+        self.cutoff = None
+        self.batches = 0
+        self.deleted = {table: 0 for table in TABLES}
+        self.error = None
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "trigger": self.trigger,
+            "older_than_days": self.older_than_days,
+            "cutoff": self.cutoff,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "batches": self.batches,
+            "deleted": dict(self.deleted),
+            "error": self.error,
+        }
+
+
+class RetentionWorker:
+    """
+    Deletes agent history older than N days in bounded batches.
+
+    Each batch picks the RETENTION_BATCH_SIZE oldest expired runs and
+    deletes their actions, plan steps and the runs themselves in one
+    short transaction, then pauses; orphaned payload blobs are swept the
+    same way at the end. Locks are held per batch, never for the whole
+    history, and a crash leaves no half-deleted run behind.
+
+    One background thread runs the jobs one at a time: the scheduled
+    sweep every RETENTION_INTERVAL_SECONDS and on-demand jobs from
+    submit(). With several app workers each one sweeps on its own
+    schedule; deletes are idempotent, so that only costs extra queries.
+    """
+
+    def __init__(self, batch_size: int, pause: float, interval: float, history: int):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.history = history
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # -------- LIFECYCLE --------
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="retention", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop after the current batch; queued jobs are cancelled."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._queue.put(None)
+        thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    # -------- JOBS --------
+    def submit(self, older_than_days: int = RETENTION_DAYS, trigger: str = "manual") -> RetentionJob:
+        job = RetentionJob(older_than_days, trigger)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+
+        if self.running:
+            self._queue.put(job)
+        else:
+            # No worker (scripts, tests): run on the caller thread
+            self.run_job(job)
+        return job
+
+    def get(self, job_id: str):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list:
+        with self._jobs_lock:
+            return list(reversed(self._jobs.values()))
+
+    # -------- WORKER THREAD --------
+    def _run(self) -> None:
+        next_sweep = time.monotonic() + self.interval if self.interval > 0 else None
+        while not self._stopping.is_set():
+            timeout = None if next_sweep is None else max(0.0, next_sweep - time.monotonic())
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                job = self.submit(RETENTION_DAYS, trigger="schedule")
+                next_sweep = time.monotonic() + self.interval
+                continue
+            if job is None:
+                break
+            self.run_job(job)
+
+        # Jobs still queued at shutdown never started
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                self._finish(job, "cancelled")
+
+    def run_job(self, job: RetentionJob) -> RetentionJob:
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        # Fixed for the whole job, so it ends even while new runs age out
+        job.cutoff = job.started_at - timedelta(days=job.older_than_days)
+        logger.info("Retention job %s started (older than %s)", job.id, job.cutoff)
+
+        try:
+            while self._delete_run_batch(job):
+                if self._pause():
+                    return self._finish(job, "cancelled")
+            # Keyset scan over payload_blobs (sha256 order)
+            after = ""
+            while True:
+                after = self._delete_blob_batch(job, after)
+                if after is None:
+                    break
+                if self._pause():
+                    return self._finish(job, "cancelled")
+        except Exception as e:
+            job.error = str(e)
+            logger.exception("Retention job %s failed", job.id)
+            return self._finish(job, "failed")
+
+        return self._finish(job, "succeeded")
+
+    def _pause(self) -> bool:
+        """Sleep between batches; True if the worker is stopping."""
+        return self._stopping.wait(self.pause)
+
+    def _finish(self, job: RetentionJob, status: str) -> RetentionJob:
+        job.status = status
+        job.finished_at = datetime.now(timezone.utc)
+        RETENTION_JOBS.inc(status=status)
+        logger.info("Retention job %s %s: %s in %d batches", job.id, status, job.deleted, job.batches)
+        return job
+
+    def _delete_run_batch(self, job: RetentionJob) -> bool:
+        db = SessionLocal()
+        try:
+            # Oldest first through ix_agent_runs_created_at_id
+            run_ids = db.scalars(
+                select(AgentRun.id)
+                .where(AgentRun.created_at < job.cutoff)
+                .order_by(AgentRun.created_at.asc(), AgentRun.id.asc())
+                .limit(self.batch_size)
+            ).all()
+            if not run_ids:
+                return False
+
+            # Children by run id (run_id indexes), so a run never outlives
+            # its audit rows or the other way round
+            counts = {}
+            for model in (AgentAction, PlannerPlan):
+                counts[model.__tablename__] = db.execute(
+                    delete(model)
+                    .where(model.run_id.in_(run_ids))
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+            counts["agent_runs"] = db.execute(
+                delete(AgentRun)
+                .where(AgentRun.id.in_(run_ids))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self._record(job, counts)
+        return len(run_ids) == self.batch_size
+
+    def _delete_blob_batch(self, job: RetentionJob, after: str) -> str | None:
+        db = SessionLocal()
+        try:
+            # Blobs shared with newer runs stay
+            deleted, after = delete_orphan_blobs(db, limit=self.batch_size, after=after)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self._record(job, {"payload_blobs": deleted})
+        return after
+
+    def _record(self, job: RetentionJob, counts: dict) -> None:
+        job.batches += 1
+        for table, count in counts.items():
+            job.deleted[table] += count
+            if count:
+                RETENTION_ROWS_DELETED.inc(count, table=table)
+
+
+retention = RetentionWorker(
+    batch_size=RETENTION_BATCH_SIZE,
+    pause=RETENTION_BATCH_PAUSE_SECONDS,
+    interval=RETENTION_INTERVAL_SECONDS,
+    history=RETENTION_JOB_HISTORY,
+)
@@ -0,0 +1,60 @@
+# agent/single_flight.py
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller
+    (leader) executes, everyone arriving while it is in flight waits
+    for and shares its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, wait_timeout: float | None = None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.followers += 1
+
+        if not leader:
+            # A leader stuck past the timeout should not hold followers hostage
+            if not call.done.wait(wait_timeout):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
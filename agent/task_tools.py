@@ -1,12 +1,17 @@
 # agent/task_tools
+import os
 from sqlalchemy.orm import Session
 from models.task import Task
 
-def get_tasks(db: Session, user_id: int):
+# Newest tasks given to the agent; older ones are reachable via /tasks/search
+AGENT_TASKS_LIMIT = int(os.getenv("AGENT_TASKS_LIMIT", "50"))
+
+def get_tasks(db: Session, user_id: int, limit: int = AGENT_TASKS_LIMIT):
     tasks = (
         db.query(Task)
         .filter(Task.user_id == user_id)
-        .order_by(Task.id.desc())
+        .order_by(Task.created_at.desc(), Task.id.desc())
+        .limit(limit)
         .all()
     )
 
@@ -23,9 +28,9 @@ def create_task(db: Session, user_id: int, title: str, description: str | None):
         user_id=user_id,
     )
 
+    # Committed together with the agent run that created it
     db.add(task)
-    db.commit()
-    db.refresh(task)
+    db.flush()
 
     return {
         "id": task.id,
@@ -0,0 +1,108 @@
+# agent/token_budget.py
+
+import threading
+from contextvars import ContextVar
+
+
+AVG_TOKENS_PER_CHAR = 0.25
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return int(len(text) * AVG_TOKENS_PER_CHAR)
+
+
+def estimate_messages_tokens(messages: list) -> int:
+    return sum(estimate_tokens(m.get("content") or "") for m in messages)
+
+
+def shrink_context(context: str, max_tokens: int) -> str:
+    """
+    Trim retrieved context to fit max_tokens.
+    Chunks are ordered by relevance, so whole leading chunks are kept.
+    """
+    if estimate_tokens(context) <= max_tokens:
+        return context
+
+    kept = []
+    used = 0
+    for chunk in context.split("\n\n"):
+        cost = estimate_tokens(chunk)
+        if used + cost > max_tokens:
+            break
+        kept.append(chunk)
+        used += cost
+
+    if not kept:
+        return context[: int(max(max_tokens, 0) / AVG_TOKENS_PER_CHAR)]
+
+    return "\n\n".join(kept)
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a run cannot continue within its token budget"""
+    pass
+
+
+# ------------------------------------------------
+# PER-RUN TOKEN METER
+# ------------------------------------------------
+class TokenMeter:
+    """
+    Accumulates real token usage (from the LLM `usage` field) for one
+    agent run. LLM calls find the active meter through a context
+    variable, so no call site has to thread it through explicitly.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+
+    @property
+    def used(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def remaining(self) -> int:
+        return max(self.limit - self.used, 0)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.used > self.limit
+
+
+_current_meter: ContextVar = ContextVar("token_meter", default=None)
+
+
+def activate_meter(meter: TokenMeter):
+    return _current_meter.set(meter)
+
+
+def deactivate_meter(token) -> None:
+    _current_meter.reset(token)
+
+
+def current_meter() -> TokenMeter | None:
+    return _current_meter.get()
+
+
+def record_usage(usage) -> None:
+    """
+    Called by the LLM client with the response `usage` object.
+    No-op outside of an agent run.
+    """
+    meter = _current_meter.get()
+    if meter is None or usage is None:
+        return
+    meter.add(
+        getattr(usage, "prompt_tokens", 0),
+        getattr(usage, "completion_tokens", 0),
+    )
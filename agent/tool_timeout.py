@@ -1,18 +1,77 @@
 # agent/tool_timeout.py
 
-import threading
-from contextlib import contextmanager
+import os
+import time
+from contextvars import ContextVar
 
 
 class ToolTimeout(Exception):
     pass
 
 
-@contextmanager
-def time_limit(seconds: int):
-    timer = threading.Timer(seconds, lambda: (_ for _ in ()).throw(ToolTimeout()))
-    timer.start()
-    try:
-        yield
-    finally:
-        timer.cancel()
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+DEFAULT_TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+RUN_DEADLINE_SECONDS = float(os.getenv("AGENT_RUN_DEADLINE_SECONDS", "45"))
+
+# Per-tool ceilings (seconds). Missing tools use the default.
+TOOL_TIMEOUTS = {
+    "retrieve_context": 10.0,
+    "generate_answer": 30.0,
+    "get_tasks": 5.0,
+    "create_task": 5.0,
+}
+
+
+# ------------------------------------------------
+# RUN DEADLINE
+# ------------------------------------------------
+class Deadline:
+    """Absolute point in (monotonic) time by which a run must finish."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+_current_deadline: ContextVar = ContextVar("run_deadline", default=None)
+
+
+def activate_deadline(deadline: Deadline):
+    return _current_deadline.set(deadline)
+
+
+def deactivate_deadline(token) -> None:
+    _current_deadline.reset(token)
+
+
+def remaining_run_time() -> float | None:
+    """Seconds left for the current run, or None outside of a run."""
+    deadline = _current_deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def tool_timeout(tool_name: str) -> float:
+    """Effective timeout for a tool: its own ceiling, capped by the run deadline."""
+    timeout = TOOL_TIMEOUTS.get(tool_name, DEFAULT_TOOL_TIMEOUT_SECONDS)
+    remaining = remaining_run_time()
+    return timeout if remaining is None else min(timeout, remaining)
+
+
+def bounded_timeout(timeout: float) -> float:
+    """
+    Cap a client-side timeout (e.g. an HTTP call) by the run deadline,
+    so abandoned work is also cut off upstream where the client allows.
+    """
+    remaining = remaining_run_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise ToolTimeout("Run deadline exceeded")
+    return min(timeout, remaining)
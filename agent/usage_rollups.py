@@ -0,0 +1,154 @@
+# agent/usage_rollups.py
+
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update, insert
+from sqlalchemy.orm import Session
+
+from models.usage_rollup import UsageRollup, ToolUsageRollup
+
+
+# bucket width per granularity
+GRANULARITIES = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+# Admin queries: default and maximum window, in buckets
+DEFAULT_BUCKETS = {"hour": 24, "day": 30}
+USAGE_MAX_BUCKETS = int(os.getenv("USAGE_MAX_BUCKETS", "744"))
+
+USAGE_COUNTERS = ("runs", "error_runs", "budget_exceeded_runs", "tokens_used")
+TOOL_COUNTERS = ("calls", "errors", "timeouts", "timed_calls", "duration_ms_total")
+# Action statuses counted as tool errors (cancelled: the client went away)
+ERROR_STATUSES = ("error", "cancelled")
+
+
+class RunUsage:
+    """
+    What one finished run adds to the usage rollups. Submitted to the
+    audit writer with the run's audit rows, so rollups are updated in
+    the same (batched) transaction, off the request path.
+    """
+
+    def __init__(self, user_id: int, tokens_used: int, failed: bool, budget_exceeded: bool):
+        self.user_id = user_id
+        self.tokens_used = tokens_used
+        self.failed = failed
+        self.budget_exceeded = budget_exceeded
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Start of the UTC hour/day containing ts."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    if granularity == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+# ------------------------------------------------
+# WRITE SIDE (AUDIT WRITER)
+# ------------------------------------------------
+def rollup_deltas(usage: list, actions: list) -> tuple:
+    """
+    Aggregate a batch into rollup row deltas.
+
+    usage:   [(RunUsage, finished_at)]
+    actions: AgentAction row dicts (tool_name, status, duration_ms, created_at)
+    """
+    runs = {}
+    for record, finished_at in usage:
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(finished_at, granularity), record.user_id)
+            row = runs.setdefault(key, dict.fromkeys(USAGE_COUNTERS, 0))
+            row["runs"] += 1
+            row["error_runs"] += int(record.failed)
+            row["budget_exceeded_runs"] += int(record.budget_exceeded)
+            row["tokens_used"] += record.tokens_used or 0
+
+    tools = {}
+    for action in actions:
+        duration = action.get("duration_ms")
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(action["created_at"], granularity), action["tool_name"])
+            row = tools.setdefault(key, {**dict.fromkeys(TOOL_COUNTERS, 0), "duration_ms_total": 0.0})
+            row["calls"] += 1
+            row["errors"] += int(action.get("status") in ERROR_STATUSES)
+            row["timeouts"] += int(action.get("status") == "timeout")
+            if duration is not None:
+                row["timed_calls"] += 1
+                row["duration_ms_total"] += duration
+
+    return (
+        [
+            {"granularity": g, "bucket_start": b, "user_id": u, **counts}
+            for (g, b, u), counts in runs.items()
+        ],
+        [
+            {"granularity": g, "bucket_start": b, "tool_name": t, **counts}
+            for (g, b, t), counts in tools.items()
+        ],
+    )
+
+
+def _add(db: Session, model, keys: tuple, counters: tuple, rows: list) -> None:
+    """counter += delta per row, inserting rows that do not exist yet."""
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    table = model.__table__
+
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+        stmt = dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={c: table.c[c] + stmt.excluded[c] for c in counters},
+        )
+        # Sorted keys: concurrent writers lock rows in the same order
+        db.execute(stmt, sorted(rows, key=lambda r: tuple(str(r[k]) for k in keys)))
+        return
+
+    for row in rows:
+        found = db.execute(
+            update(model)
+            .where(*(table.c[k] == row[k] for k in keys))
+            .values({c: table.c[c] + row[c] for c in counters})
+        ).rowcount
+        if not found:
+            db.execute(insert(model), row)
+
+
+def save_rollups(db: Session, usage: list, actions: list) -> None:
+    runs, tools = rollup_deltas(usage, actions)
+    _add(db, UsageRollup, ("granularity", "bucket_start", "user_id"), USAGE_COUNTERS, runs)
+    _add(db, ToolUsageRollup, ("granularity", "bucket_start", "tool_name"), TOOL_COUNTERS, tools)
+
+
+# ------------------------------------------------
+# READ SIDE (ADMIN)
+# ------------------------------------------------
+def usage_window(granularity: str, since: datetime | None, until: datetime | None) -> tuple:
+    """
+    (since, until) bucket starts, both inclusive. Defaults to the last
+    DEFAULT_BUCKETS buckets; never spans more than USAGE_MAX_BUCKETS, so
+    a query reads a bounded number of rollup rows whatever the history.
+    """
+    width = GRANULARITIES[granularity]
+    until = bucket_start(until or datetime.now(timezone.utc), granularity)
+    earliest = until - width * (USAGE_MAX_BUCKETS - 1)
+    if since is None:
+        since = until - width * (DEFAULT_BUCKETS[granularity] - 1)
+    return max(bucket_start(since, granularity), earliest), until
+
+
+def rate(part: int, total: int) -> float:
+    return round(part / total, 4) if total else 0.0
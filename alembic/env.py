@@ -25,6 +25,16 @@ config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL"))
 
 target_metadata = Base.metadata
 
+# Full-text search objects are created by raw DDL (models/task.py),
+# not declared on the models: keep autogenerate from dropping them
+SEARCH_OBJECTS = {"search_vector", "ix_tasks_search_vector"}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if name in SEARCH_OBJECTS or (name or "").startswith("tasks_fts"):
+        return False
+    return True
+
 
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
@@ -33,6 +43,7 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
     with context.begin_transaction():
         context.run_migrations()
@@ -40,9 +51,14 @@ def run_migrations_offline():
 
 def run_migrations_online():
     with engine.connect() as connection:
+        # Index builds may run longer than the app's statement timeout
+        if connection.dialect.name == "postgresql":
+            connection.exec_driver_sql("SET statement_timeout = 0")
+
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_object=include_object,
         )
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,50 @@
+"""add payload_blobs and blob references on agent_actions
+
+Revision ID: 2b5002da5df1
+Revises: 2fb36760b29a
+Create Date: 2026-10-19 15:22:53.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b5002da5df1'
+down_revision: Union[str, Sequence[str], None] = '2fb36760b29a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "payload_blobs",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+
+    op.add_column(
+        "agent_actions",
+        sa.Column("tool_input_blob", sa.String(length=64), nullable=True),
+    )
+
+    op.add_column(
+        "agent_actions",
+        sa.Column("tool_output_blob", sa.String(length=64), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("agent_actions", "tool_output_blob")
+    op.drop_column("agent_actions", "tool_input_blob")
+    op.drop_table("payload_blobs")
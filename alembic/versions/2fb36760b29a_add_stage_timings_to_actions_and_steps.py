@@ -0,0 +1,37 @@
+"""add stage timings to agent_actions and planner_plans
+
+Revision ID: 2fb36760b29a
+Revises: 965c073badae
+Create Date: 2026-10-19 13:41:08.207315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2fb36760b29a'
+down_revision: Union[str, Sequence[str], None] = '965c073badae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ("agent_actions", "planner_plans"):
+        op.add_column(
+            table,
+            sa.Column("start_offset_ms", sa.Float(), nullable=True),
+        )
+
+        op.add_column(
+            table,
+            sa.Column("duration_ms", sa.Float(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    for table in ("planner_plans", "agent_actions"):
+        op.drop_column(table, "duration_ms")
+        op.drop_column(table, "start_offset_ms")
@@ -0,0 +1,36 @@
+"""payload_blobs.last_used_at for the orphan sweep grace period
+
+Revision ID: 3a7e5c9d1b24
+Revises: 8d1f3b6c0e27
+Create Date: 2026-10-19 19:52:37.418206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a7e5c9d1b24'
+down_revision: Union[str, Sequence[str], None] = '8d1f3b6c0e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "payload_blobs",
+        sa.Column(
+            "last_used_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+    )
+    # Existing blobs were last written when they were created
+    op.execute("UPDATE payload_blobs SET last_used_at = created_at")
+
+
+def downgrade() -> None:
+    op.drop_column("payload_blobs", "last_used_at")
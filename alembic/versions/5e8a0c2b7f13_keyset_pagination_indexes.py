@@ -0,0 +1,54 @@
+"""tasks.created_at and keyset pagination indexes
+
+Revision ID: 5e8a0c2b7f13
+Revises: 7c1e93f4d2a6
+Create Date: 2026-10-19 17:24:10.662081
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8a0c2b7f13'
+down_revision: Union[str, Sequence[str], None] = '7c1e93f4d2a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing tasks get the migration time; id still orders them
+    op.add_column(
+        "tasks",
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+    )
+
+    op.create_index(
+        "ix_tasks_user_id_created_at_id",
+        "tasks",
+        ["user_id", "created_at", "id"],
+    )
+    op.create_index(
+        "ix_documents_user_id_created_at_id",
+        "documents",
+        ["user_id", "created_at", "id"],
+    )
+    op.create_index(
+        "ix_agent_runs_created_at_id",
+        "agent_runs",
+        ["created_at", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_agent_runs_created_at_id", table_name="agent_runs")
+    op.drop_index("ix_documents_user_id_created_at_id", table_name="documents")
+    op.drop_index("ix_tasks_user_id_created_at_id", table_name="tasks")
+    op.drop_column("tasks", "created_at")
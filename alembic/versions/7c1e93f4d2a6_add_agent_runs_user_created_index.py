@@ -0,0 +1,30 @@
+"""add (user_id, created_at) index on agent_runs
+
+Revision ID: 7c1e93f4d2a6
+Revises: 2b5002da5df1
+Create Date: 2026-10-19 16:05:41.218374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e93f4d2a6'
+down_revision: Union[str, Sequence[str], None] = '2b5002da5df1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_agent_runs_user_id_created_at",
+        "agent_runs",
+        ["user_id", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_agent_runs_user_id_created_at", table_name="agent_runs")
@@ -0,0 +1,71 @@
+"""full-text search index over task title and description
+
+Revision ID: 8d1f3b6c0e27
+Revises: f4b7d2e9a615
+Create Date: 2026-10-19 18:41:09.275530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d1f3b6c0e27'
+down_revision: Union[str, Sequence[str], None] = 'f4b7d2e9a615'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        # Generated column: Postgres keeps it in sync on every write
+        op.execute(
+            "ALTER TABLE tasks ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', "
+            "coalesce(title, '') || ' ' || coalesce(description, ''))) STORED"
+        )
+        op.execute("CREATE INDEX ix_tasks_search_vector ON tasks USING gin (search_vector)")
+
+    elif dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE tasks_fts USING fts5("
+            "title, description, content='tasks', content_rowid='id', "
+            "tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_ai AFTER INSERT ON tasks BEGIN "
+            "INSERT INTO tasks_fts(rowid, title, description) "
+            "VALUES (new.id, new.title, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_ad AFTER DELETE ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "INSERT INTO tasks_fts(rowid, title, description) "
+            "VALUES (new.id, new.title, new.description); END"
+        )
+        # Index the existing tasks
+        op.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        op.drop_index("ix_tasks_search_vector", table_name="tasks")
+        op.drop_column("tasks", "search_vector")
+
+    elif dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_ai")
+        op.execute("DROP TABLE IF EXISTS tasks_fts")
@@ -0,0 +1,38 @@
+"""add idempotency key to agent_runs
+
+Revision ID: 965c073badae
+Revises: a4ac753a2a91
+Create Date: 2026-10-19 11:03:27.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '965c073badae'
+down_revision: Union[str, Sequence[str], None] = 'a4ac753a2a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "agent_runs",
+        sa.Column("idempotency_key", sa.String(length=255), nullable=True),
+    )
+
+    # NULL keys never collide, so runs without a key are unaffected
+    op.create_index(
+        "ix_agent_runs_user_id_idempotency_key",
+        "agent_runs",
+        ["user_id", "idempotency_key"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_agent_runs_user_id_idempotency_key", table_name="agent_runs")
+    op.drop_column("agent_runs", "idempotency_key")
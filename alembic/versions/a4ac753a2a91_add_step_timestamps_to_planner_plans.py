@@ -0,0 +1,35 @@
+"""add step timestamps to planner_plans
+
+Revision ID: a4ac753a2a91
+Revises: 3d32acd673b8
+Create Date: 2026-10-19 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4ac753a2a91'
+down_revision: Union[str, Sequence[str], None] = '3d32acd673b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "planner_plans",
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+    op.add_column(
+        "planner_plans",
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("planner_plans", "finished_at")
+    op.drop_column("planner_plans", "started_at")
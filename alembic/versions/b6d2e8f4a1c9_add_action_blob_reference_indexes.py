@@ -0,0 +1,35 @@
+"""indexes on agent_actions blob references for the orphan sweep
+
+Revision ID: b6d2e8f4a1c9
+Revises: 3a7e5c9d1b24
+Create Date: 2026-10-19 20:14:05.903127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d2e8f4a1c9'
+down_revision: Union[str, Sequence[str], None] = '3a7e5c9d1b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Partial: only actions with an externalized payload are indexed
+    for column in ("tool_input_blob", "tool_output_blob"):
+        op.create_index(
+            f"ix_agent_actions_{column}",
+            "agent_actions",
+            [column],
+            postgresql_where=sa.text(f"{column} IS NOT NULL"),
+            sqlite_where=sa.text(f"{column} IS NOT NULL"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_agent_actions_tool_output_blob", table_name="agent_actions")
+    op.drop_index("ix_agent_actions_tool_input_blob", table_name="agent_actions")
@@ -0,0 +1,37 @@
+"""add composite indexes on agent_actions and planner_plans
+
+Revision ID: c93d5a1e8b40
+Revises: 5e8a0c2b7f13
+Create Date: 2026-10-19 17:48:32.107245
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c93d5a1e8b40'
+down_revision: Union[str, Sequence[str], None] = '5e8a0c2b7f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Neither table had any index besides its primary key
+    op.create_index(
+        "ix_agent_actions_run_id_created_at_id",
+        "agent_actions",
+        ["run_id", "created_at", "id"],
+    )
+    op.create_index(
+        "ix_planner_plans_run_id_step_index",
+        "planner_plans",
+        ["run_id", "step_index"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_planner_plans_run_id_step_index", table_name="planner_plans")
+    op.drop_index("ix_agent_actions_run_id_created_at_id", table_name="agent_actions")
@@ -0,0 +1,102 @@
+"""add hourly/daily usage rollups
+
+Revision ID: f4b7d2e9a615
+Revises: c93d5a1e8b40
+Create Date: 2026-10-19 18:02:37.415208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b7d2e9a615'
+down_revision: Union[str, Sequence[str], None] = 'c93d5a1e8b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "usage_rollups",
+        sa.Column("granularity", sa.String(length=8), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("runs", sa.Integer(), nullable=False),
+        sa.Column("error_runs", sa.Integer(), nullable=False),
+        sa.Column("budget_exceeded_runs", sa.Integer(), nullable=False),
+        sa.Column("tokens_used", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("granularity", "bucket_start", "user_id"),
+    )
+    op.create_index(
+        "ix_usage_rollups_user_id_granularity_bucket",
+        "usage_rollups",
+        ["user_id", "granularity", "bucket_start"],
+    )
+
+    op.create_table(
+        "tool_usage_rollups",
+        sa.Column("granularity", sa.String(length=8), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("tool_name", sa.String(), nullable=False),
+        sa.Column("calls", sa.Integer(), nullable=False),
+        sa.Column("errors", sa.Integer(), nullable=False),
+        sa.Column("timeouts", sa.Integer(), nullable=False),
+        sa.Column("timed_calls", sa.Integer(), nullable=False),
+        sa.Column("duration_ms_total", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("granularity", "bucket_start", "tool_name"),
+    )
+
+    # Backfill from the history still on disk (bucketed by created_at;
+    # new runs are bucketed when they finish)
+    dialect = op.get_bind().dialect.name
+
+    for granularity in ("hour", "day"):
+        if dialect == "postgresql":
+            # UTC bucket start, back as timestamptz
+            bucket = f"date_trunc('{granularity}', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'"
+        elif dialect == "sqlite":
+            # Same text format SQLAlchemy stores DateTime values in
+            fmt = "%Y-%m-%d %H:00:00.000000" if granularity == "hour" else "%Y-%m-%d 00:00:00.000000"
+            bucket = f"strftime('{fmt}', created_at)"
+        else:
+            # Rollups then only cover runs finished after the upgrade
+            break
+
+        op.execute(
+            f"""
+            INSERT INTO usage_rollups
+                (granularity, bucket_start, user_id, runs, error_runs, budget_exceeded_runs, tokens_used)
+            SELECT '{granularity}', {bucket}, user_id,
+                   count(*),
+                   sum(CASE WHEN output LIKE 'ERROR%' THEN 1 ELSE 0 END),
+                   sum(CASE WHEN budget_exceeded THEN 1 ELSE 0 END),
+                   coalesce(sum(estimated_tokens_used), 0)
+            FROM agent_runs
+            WHERE output IS NOT NULL
+            GROUP BY 2, 3
+            """
+        )
+        op.execute(
+            f"""
+            INSERT INTO tool_usage_rollups
+                (granularity, bucket_start, tool_name, calls, errors, timeouts, timed_calls, duration_ms_total)
+            SELECT '{granularity}', {bucket}, tool_name,
+                   count(*),
+                   sum(CASE WHEN status IN ('error', 'cancelled') THEN 1 ELSE 0 END),
+                   sum(CASE WHEN status = 'timeout' THEN 1 ELSE 0 END),
+                   count(duration_ms),
+                   coalesce(sum(duration_ms), 0)
+            FROM agent_actions
+            GROUP BY 2, 3
+            """
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("tool_usage_rollups")
+    op.drop_index("ix_usage_rollups_user_id_granularity_bucket", table_name="usage_rollups")
+    op.drop_table("usage_rollups")
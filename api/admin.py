@@ -1,42 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Literal
 
-from db.database import SessionLocal
-from api.auth_helpers import get_current_user
+from db.database import get_async_db
+from api.auth_helpers import get_current_user_async
 from api.admin_guard import require_admin
+from core.pagination import NEXT_CURSOR_HEADER, keyset, split_page
 
 from models.agent_run import AgentRun
 from models.agent_action import AgentAction
+from models.planner_plan import PlannerPlan
+from models.usage_rollup import UsageRollup, ToolUsageRollup
+from agent.llm_client import get_llm_metrics
+from agent.answer_cache import answer_cache
+from agent.payloads import load_payloads, payload
+from agent.retention import RETENTION_DAYS, retention
+from agent.usage_rollups import rate, usage_window
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ─────────────────────────────────────
 # 🔍 VIEW ALL AGENT RUNS
 # ─────────────────────────────────────
 @router.get("/agent-runs")
-def list_agent_runs(
-    limit: int = 50,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+async def list_agent_runs(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
 ):
     require_admin(current_user)
 
-    runs = (
-        db.query(AgentRun)
-        .order_by(AgentRun.created_at.desc())
-        .limit(limit)
-        .all()
+    # Newest first; X-Next-Cursor -> ?cursor= for the next page
+    stmt = keyset(
+        select(AgentRun),
+        AgentRun.created_at,
+        AgentRun.id,
+        cursor,
+        limit,
+        db.bind.dialect.name,
     )
+    runs, next_page = split_page((await db.scalars(stmt)).all(), limit)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
 
     return [
         {
@@ -54,23 +64,26 @@ def list_agent_runs(
 # 🔎 VIEW ACTIONS FOR A RUN
 # ─────────────────────────────────────
 @router.get("/agent-runs/{run_id}/actions")
-def list_agent_run_actions(
+async def list_agent_run_actions(
     run_id: int,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
 ):
     require_admin(current_user)
 
-    run = db.query(AgentRun).filter(AgentRun.id == run_id).first()
+    run = await db.get(AgentRun, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Agent run not found")
 
     actions = (
-        db.query(AgentAction)
-        .filter(AgentAction.run_id == run_id)
-        .order_by(AgentAction.created_at.asc())
-        .all()
-    )
+        await db.scalars(
+            select(AgentAction)
+            .where(AgentAction.run_id == run_id)
+            .order_by(AgentAction.created_at.asc(), AgentAction.id.asc())
+        )
+    ).all()
+    # Large payloads are stored compressed in payload_blobs
+    blobs = await db.run_sync(load_payloads, actions)
 
     return {
         "run_id": run_id,
@@ -80,8 +93,8 @@ def list_agent_run_actions(
             {
                 "id": a.id,
                 "tool_name": a.tool_name,
-                "tool_input": a.tool_input,
-                "tool_output": a.tool_output,
+                "tool_input": payload(a, "tool_input", blobs),
+                "tool_output": payload(a, "tool_output", blobs),
                 "created_at": a.created_at,
             }
             for a in actions
@@ -90,35 +103,319 @@ def list_agent_run_actions(
 
 
 # ─────────────────────────────────────
-# 🧹 CLEANUP OLD LOGS
+# ⏱️ STAGE WATERFALL FOR A RUN
 # ─────────────────────────────────────
-@router.delete("/cleanup-agent-logs")
-def cleanup_agent_logs(
-    days: int = 7,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+@router.get("/agent-runs/{run_id}/waterfall")
+async def agent_run_waterfall(
+    run_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
 ):
     require_admin(current_user)
 
-    cutoff = datetime.utcnow() - timedelta(days=days)
+    run = await db.get(AgentRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Agent run not found")
+
+    actions = (
+        await db.scalars(
+            select(AgentAction)
+            .where(AgentAction.run_id == run_id)
+            .order_by(AgentAction.id.asc())
+        )
+    ).all()
+    steps = (
+        await db.scalars(
+            select(PlannerPlan)
+            .where(PlannerPlan.run_id == run_id)
+            .order_by(PlannerPlan.step_index.asc())
+        )
+    ).all()
 
-    deleted_actions = (
-        db.query(AgentAction)
-        .filter(AgentAction.created_at < cutoff)
-        .delete(synchronize_session=False)
-    )
+    def end(row):
+        if row.start_offset_ms is None or row.duration_ms is None:
+            return None
+        return round(row.start_offset_ms + row.duration_ms, 3)
 
-    deleted_runs = (
-        db.query(AgentRun)
-        .filter(AgentRun.created_at < cutoff)
-        .delete(synchronize_session=False)
+    # Stages sorted by when they started; untimed rows (older runs) last
+    timed = sorted(
+        actions,
+        key=lambda a: (a.start_offset_ms is None, a.start_offset_ms or 0.0),
     )
+    ends = [end(a) for a in actions if end(a) is not None]
+
+    return {
+        "run_id": run_id,
+        "input": run.input,
+        "total_ms": max(ends) if ends else None,
+        "stages": [
+            {
+                "tool_name": a.tool_name,
+                "status": a.status,
+                "start_offset_ms": a.start_offset_ms,
+                "duration_ms": a.duration_ms,
+                "end_offset_ms": end(a),
+            }
+            for a in timed
+        ],
+        "steps": [
+            {
+                "step_index": p.step_index,
+                "tool_name": p.tool_name,
+                "status": p.status,
+                "start_offset_ms": p.start_offset_ms,
+                "duration_ms": p.duration_ms,
+                "end_offset_ms": end(p),
+            }
+            for p in steps
+        ],
+    }
+
+
+# ─────────────────────────────────────
+# 🧹 CLEANUP OLD LOGS (background retention job)
+# ─────────────────────────────────────
+@router.delete("/cleanup-agent-logs", status_code=202)
+async def cleanup_agent_logs(
+    # At least a day: a cutoff of "now" would delete runs still in flight
+    days: int = Query(RETENTION_DAYS, ge=1),
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
 
-    db.commit()
+    # Runs in batches on the retention thread; poll the job for progress
+    job = retention.submit(days)
 
     return {
-        "status": "success",
-        "deleted_agent_actions": deleted_actions,
-        "deleted_agent_runs": deleted_runs,
+        "status": "accepted",
+        "job_id": job.id,
         "older_than_days": days,
     }
+
+
+@router.get("/retention-jobs")
+async def list_retention_jobs(
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    return [job.as_dict() for job in retention.jobs()]
+
+
+@router.get("/retention-jobs/{job_id}")
+async def get_retention_job(
+    job_id: str,
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    job = retention.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Retention job not found")
+
+    return job.as_dict()
+
+
+# ─────────────────────────────────────
+# 📊 USAGE (FROM HOURLY / DAILY ROLLUPS)
+# ─────────────────────────────────────
+# Rollups are updated by the audit writer as runs finish; these reads
+# touch at most (buckets x users/tools) rows, never the raw history.
+Granularity = Literal["hour", "day"]
+
+
+@router.get("/usage")
+async def usage_over_time(
+    granularity: Granularity = "hour",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    user_id: int | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    since, until = usage_window(granularity, since, until)
+    stmt = (
+        select(
+            UsageRollup.bucket_start,
+            func.sum(UsageRollup.runs),
+            func.sum(UsageRollup.error_runs),
+            func.sum(UsageRollup.budget_exceeded_runs),
+            func.sum(UsageRollup.tokens_used),
+        )
+        .where(
+            UsageRollup.granularity == granularity,
+            UsageRollup.bucket_start >= since,
+            UsageRollup.bucket_start <= until,
+        )
+        .group_by(UsageRollup.bucket_start)
+        .order_by(UsageRollup.bucket_start.asc())
+    )
+    if user_id is not None:
+        stmt = stmt.where(UsageRollup.user_id == user_id)
+
+    buckets = [
+        {
+            "bucket_start": bucket,
+            "runs": runs,
+            "error_runs": errors,
+            "error_rate": rate(errors, runs),
+            "budget_exceeded_runs": budget,
+            "tokens_used": tokens,
+        }
+        for bucket, runs, errors, budget, tokens in (await db.execute(stmt)).all()
+    ]
+    runs = sum(b["runs"] for b in buckets)
+    errors = sum(b["error_runs"] for b in buckets)
+
+    return {
+        "granularity": granularity,
+        "since": since,
+        "until": until,
+        "user_id": user_id,
+        "totals": {
+            "runs": runs,
+            "error_runs": errors,
+            "error_rate": rate(errors, runs),
+            "budget_exceeded_runs": sum(b["budget_exceeded_runs"] for b in buckets),
+            "tokens_used": sum(b["tokens_used"] for b in buckets),
+        },
+        "buckets": buckets,
+    }
+
+
+@router.get("/usage/users")
+async def usage_by_user(
+    granularity: Granularity = "day",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int = Query(20, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    since, until = usage_window(granularity, since, until)
+    runs = func.sum(UsageRollup.runs)
+    tokens = func.sum(UsageRollup.tokens_used)
+    rows = (
+        await db.execute(
+            select(
+                UsageRollup.user_id,
+                runs,
+                func.sum(UsageRollup.error_runs),
+                func.sum(UsageRollup.budget_exceeded_runs),
+                tokens,
+            )
+            .where(
+                UsageRollup.granularity == granularity,
+                UsageRollup.bucket_start >= since,
+                UsageRollup.bucket_start <= until,
+            )
+            .group_by(UsageRollup.user_id)
+            .order_by(runs.desc(), tokens.desc(), UsageRollup.user_id.asc())
+            .limit(limit)
+        )
+    ).all()
+
+    return {
+        "granularity": granularity,
+        "since": since,
+        "until": until,
+        "users": [
+            {
+                "user_id": uid,
+                "runs": user_runs,
+                "error_runs": errors,
+                "error_rate": rate(errors, user_runs),
+                "budget_exceeded_runs": budget,
+                "tokens_used": user_tokens,
+            }
+            for uid, user_runs, errors, budget, user_tokens in rows
+        ],
+    }
+
+
+@router.get("/usage/tools")
+async def usage_by_tool(
+    granularity: Granularity = "hour",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    since, until = usage_window(granularity, since, until)
+    rollups = (
+        await db.scalars(
+            select(ToolUsageRollup)
+            .where(
+                ToolUsageRollup.granularity == granularity,
+                ToolUsageRollup.bucket_start >= since,
+                ToolUsageRollup.bucket_start <= until,
+            )
+            .order_by(ToolUsageRollup.tool_name.asc(), ToolUsageRollup.bucket_start.asc())
+        )
+    ).all()
+
+    def stats(calls, errors, timeouts, timed, duration_ms) -> dict:
+        return {
+            "calls": calls,
+            "errors": errors,
+            "timeouts": timeouts,
+            "error_rate": rate(errors + timeouts, calls),
+            "avg_duration_ms": round(duration_ms / timed, 3) if timed else None,
+        }
+
+    tools = {}
+    for r in rollups:
+        tool = tools.setdefault(r.tool_name, {"totals": [0, 0, 0, 0, 0.0], "buckets": []})
+        counts = (r.calls, r.errors, r.timeouts, r.timed_calls, r.duration_ms_total)
+        tool["totals"] = [a + b for a, b in zip(tool["totals"], counts)]
+        tool["buckets"].append({"bucket_start": r.bucket_start, **stats(*counts)})
+
+    return {
+        "granularity": granularity,
+        "since": since,
+        "until": until,
+        "tools": {
+            name: {**stats(*tool["totals"]), "buckets": tool["buckets"]}
+            for name, tool in tools.items()
+        },
+    }
+
+
+# ─────────────────────────────────────
+# 📈 LLM CALL METRICS
+# ─────────────────────────────────────
+@router.get("/llm-metrics")
+async def llm_metrics(
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    return get_llm_metrics()
+
+
+# ─────────────────────────────────────
+# 🧠 SEMANTIC ANSWER CACHE
+# ─────────────────────────────────────
+@router.get("/answer-cache")
+async def answer_cache_stats(
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    return answer_cache.stats()
+
+
+@router.delete("/answer-cache")
+async def clear_answer_cache(
+    current_user=Depends(get_current_user_async),
+):
+    require_admin(current_user)
+
+    answer_cache.clear()
+    return {"status": "success"}
@@ -1,27 +1,165 @@
 # api/agent.py
 
-from fastapi import APIRouter, Depends
+import asyncio
+import json
+import logging
+import threading
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from api.auth_helpers import get_current_user
-from db.database import SessionLocal
-from agent.engine import run_agent
+from db.database import SessionLocal, get_db
+from agent.engine import run_agent, find_idempotent_run, stored_run_result
+from agent.batch import run_agent_batch
+from agent.execution_limits import current_quota
+from models.schemas import AgentBatchRequest
 
 router = APIRouter(prefix="/agent", tags=["Agent"])
 
+logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# How often the SSE loop checks whether the client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+def _with_quota(response: Response, result: dict) -> dict:
+    """Rate-limit headers (and a real 429) from the check made during this request."""
+    quota = current_quota()
+    if quota is not None:
+        response.headers.update(quota.headers())
+    if isinstance(result, dict) and result.get("status") == 429:
+        response.status_code = 429
+    return result
+
+
+def _replay(response: Response, run, prompt: str) -> dict:
+    """Stored result for a reused Idempotency-Key, with its real status."""
+    result = stored_run_result(run, prompt)
+    if "status" in result:
+        response.status_code = result["status"]
+    return result
 
 
 @router.post("/run")
 def run_agent_endpoint(
     prompt: str,
+    response: Response,
+    fresh: bool = False,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    # Retried request: replay the stored result instead of re-running
+    if idempotency_key:
+        existing = find_idempotent_run(db, current_user.id, idempotency_key)
+        if existing:
+            return _replay(response, existing, prompt)
+
+    try:
+        return _with_quota(
+            response,
+            run_agent(
+                prompt,
+                current_user,
+                db,
+                fresh=fresh,
+                idempotency_key=idempotency_key,
+            ),
+        )
+    except IntegrityError:
+        # Another worker claimed the same key first
+        db.rollback()
+        existing = find_idempotent_run(db, current_user.id, idempotency_key)
+        if not existing:
+            raise
+        return _replay(response, existing, prompt)
+
+
+@router.post("/run-batch")
+def run_agent_batch_endpoint(
+    payload: AgentBatchRequest,
+    response: Response,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    return run_agent(prompt, current_user, db)
+    return _with_quota(
+        response,
+        run_agent_batch(payload.prompts, current_user, db, fresh=payload.fresh),
+    )
+
+
+# ------------------------------------------------
+# STREAMING (SERVER-SENT EVENTS)
+# ------------------------------------------------
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/run/stream")
+async def run_agent_stream_endpoint(
+    prompt: str,
+    request: Request,
+    fresh: bool = False,
+    current_user=Depends(get_current_user),
+):
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    cancel_event = threading.Event()
+
+    def emit(event: str, data) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    def worker() -> None:
+        # The run outlives the request scope, so it owns its session
+        db = SessionLocal()
+        try:
+            result = run_agent(
+                prompt,
+                current_user,
+                db,
+                on_event=emit,
+                cancel_event=cancel_event,
+                fresh=fresh,
+            )
+            emit("done", result)
+        except HTTPException as e:
+            emit("error", {"error": e.detail, "status": e.status_code})
+        except Exception:
+            logger.exception("Streaming agent run failed")
+            emit("error", {"error": "Internal server error"})
+        finally:
+            db.close()
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    loop.run_in_executor(None, worker)
+
+    async def event_stream():
+        try:
+            while True:
+                if await request.is_disconnected():
+                    break
+
+                try:
+                    item = await asyncio.wait_for(
+                        events.get(), timeout=DISCONNECT_POLL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    continue
+
+                if item is None:
+                    break
+
+                event, data = item
+                yield _sse(event, data)
+        finally:
+            # 🔒 Client gone (or stream finished): stop upstream generation
+            cancel_event.set()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
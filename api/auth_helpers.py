@@ -1,38 +1,183 @@
 # api/auth_helpers.py 
 
+import os
+import threading
+import time
+
 from jose import jwt, JWTError
 from fastapi import HTTPException, Depends, status 
 from fastapi.security import OAuth2PasswordBearer
-from db.database import SessionLocal
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from db.database import get_db, get_async_db
 from models.user import User as UserModel 
 from core.config import SECRET_KEY, ALGORITHM
+from core.stage_timer import stage
+from core import metrics
 
 # ----------------------------------------------------
 # 1. Define the OAuth2 Scheme
 # ----------------------------------------------------
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token") 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    db = SessionLocal()
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
-        user_id = payload.get("sub")
-        role = payload.get("role")
+# ----------------------------------------------------
+# 2. Token -> user cache
+# ----------------------------------------------------
+# 0 disables the cache (every request queries users)
+AUTH_USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "10000"))
+
+AUTH_CACHE_LOOKUPS = metrics.counter(
+    "auth_user_cache_lookups_total",
+    "Token to user resolutions by result",
+    ("result",),
+)
+
+
+class UserCache:
+    """
+    Resolved users per token, for a few seconds.
+
+    Keyed by (user id, jti, exp), so each token gets its own entry with the
+    role from its own claims. Entries are detached User objects shared
+    between requests (read-only). Any update or delete of a user evicts
+    all of that user's entries; the TTL bounds staleness across workers.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key: tuple):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            return user
+
+    def put(self, key: tuple, user, token_exp: float | None) -> None:
+        if self.ttl_seconds <= 0:
+            return
+
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            # Never outlive the token itself
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict_expired()
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (user, time.monotonic() + ttl)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (_, exp) in self._entries.items() if exp <= now]:
+            del self._entries[key]
+
+
+user_cache = UserCache(AUTH_USER_CACHE_TTL_SECONDS, AUTH_USER_CACHE_MAX_ENTRIES)
+
 
-        if user_id is None or role is None:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def _evict_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
 
-        user = db.query(UserModel).filter(UserModel.id == int(user_id)).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
 
-        # 🔑 Inject role from token
-        user.role = role
+# ----------------------------------------------------
+# 3. Current user dependency
+# ----------------------------------------------------
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+):
+    with stage("auth"):
+        claims = _decode(token)
+        user = _cached_user(claims)
+        if user is None:
+            # Same session as the route (FastAPI caches the get_db dependency)
+            user = db.get(UserModel, claims["user_id"])
+            user = _remember_user(claims, user, db.expunge)
+        return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """get_current_user for async endpoints (same cache, async session)."""
+    with stage("auth"):
+        claims = _decode(token)
+        user = _cached_user(claims)
+        if user is None:
+            user = await db.get(UserModel, claims["user_id"])
+            user = _remember_user(claims, user, db.expunge)
         return user
 
+
+def _decode(token: str) -> dict:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         raise HTTPException(status_code=401, detail="Token validation error")
 
-    finally:
-        db.close()
+    user_id = payload.get("sub")
+    role = payload.get("role")
+
+    if user_id is None or role is None:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    return {
+        "user_id": user_id,
+        "role": role,
+        "exp": payload.get("exp"),
+        "key": (user_id, payload.get("jti"), payload.get("exp")),
+    }
+
+
+def _cached_user(claims: dict):
+    user = user_cache.get(claims["key"])
+    AUTH_CACHE_LOOKUPS.inc(result="miss" if user is None else "hit")
+    return user
+
+
+def _remember_user(claims: dict, user, expunge):
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    # Detach: the object is shared across requests and must not be
+    # flushed, expired or refreshed by this request's session
+    expunge(user)
+
+    # 🔑 Inject role from token
+    user.role = claims["role"]
+
+    user_cache.put(claims["key"], user, claims["exp"])
+    return user
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, UploadFile, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
-from api.auth_helpers import get_current_user
-from db.database import SessionLocal
+from api.auth_helpers import get_current_user_async
+from db.database import get_async_db
+from core.pagination import NEXT_CURSOR_HEADER, keyset, split_page
 from rag.vector_store import get_vector_store, delete_document
 from rag.chunking import extract_and_chunk_pdf
 from models.document import Document
@@ -11,30 +14,19 @@ from models.document import Document
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
 
-# ------------------------------------------------
-# DB Dependency
-# ------------------------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ------------------------------------------------
 # UPLOAD DOCUMENT
 # ------------------------------------------------
 @router.post("/upload")
-def upload_document(
+async def upload_document(
     file: UploadFile,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
 ):
     doc_id = str(uuid.uuid4())
 
-    # 1️⃣ Chunk + embed
-    docs = extract_and_chunk_pdf(file)
+    # 1️⃣ Chunk + embed (CPU / Chroma work stays off the event loop)
+    docs = await run_in_threadpool(extract_and_chunk_pdf, file)
 
     if not docs:
         raise HTTPException(
@@ -48,9 +40,9 @@ def upload_document(
             "filename": file.filename,
         }
 
-    vector_store = get_vector_store(current_user.id)
-    vector_store.add_documents(docs)
-    
+    vector_store = await run_in_threadpool(get_vector_store, current_user.id)
+    await run_in_threadpool(vector_store.add_documents, docs)
+
 
     # 2️⃣ Save document metadata (SOURCE OF TRUTH)
     db_doc = Document(
@@ -59,7 +51,7 @@ def upload_document(
         user_id=current_user.id,
     )
     db.add(db_doc)
-    db.commit()
+    await db.commit()
 
     return {
         "message": "Document ingested successfully",
@@ -71,17 +63,39 @@ def upload_document(
 # ------------------------------------------------
 # LIST DOCUMENTS
 # ------------------------------------------------
+# Page size when only a cursor is given
+DOCUMENTS_PAGE_SIZE = 50
+
+
 @router.get("/list")
-def list_documents(
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+async def list_documents(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=200),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
 ):
-    documents = (
-        db.query(Document)
-        .filter(Document.user_id == current_user.id)
-        .order_by(Document.created_at.desc())
-        .all()
-    )
+    stmt = select(Document).where(Document.user_id == current_user.id)
+
+    # Paging is opt-in: without limit/cursor every document is returned,
+    # as before, so clients unaware of X-Next-Cursor lose nothing
+    if limit is None and cursor is None:
+        stmt = stmt.order_by(Document.created_at.desc(), Document.id.desc())
+        documents = (await db.scalars(stmt)).all()
+    else:
+        # Newest first; pass the X-Next-Cursor header back as ?cursor= for the next page
+        limit = limit or DOCUMENTS_PAGE_SIZE
+        stmt = keyset(
+            stmt,
+            Document.created_at,
+            Document.id,
+            cursor,
+            limit,
+            db.bind.dialect.name,
+        )
+        documents, next_page = split_page((await db.scalars(stmt)).all(), limit)
+        if next_page:
+            response.headers[NEXT_CURSOR_HEADER] = next_page
 
     return [
         {
@@ -97,19 +111,17 @@ def list_documents(
 # DELETE SINGLE DOCUMENT
 # ------------------------------------------------
 @router.delete("/delete/{doc_id}")
-def delete_single_document(
+async def delete_single_document(
     doc_id: str,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
 ):
     # 1️⃣ Check SQL source of truth
-    document = (
-        db.query(Document)
-        .filter(
+    document = await db.scalar(
+        select(Document).where(
             Document.id == doc_id,
             Document.user_id == current_user.id,
         )
-        .first()
     )
 
     if not document:
@@ -119,14 +131,15 @@ def delete_single_document(
         )
 
     # 2️⃣ Delete from vector DB
-    delete_document(
+    await run_in_threadpool(
+        delete_document,
         user_id=current_user.id,
         doc_id=doc_id,
     )
 
     # 3️⃣ Delete SQL metadata
-    db.delete(document)
-    db.commit()
+    await db.delete(document)
+    await db.commit()
 
     return {
         "message": f"Document {doc_id} deleted successfully"
@@ -137,20 +150,20 @@ def delete_single_document(
 # DELETE ALL DOCUMENTS (FIXED PATH)
 # ------------------------------------------------
 @router.delete("/delete-all")
-def delete_all_documents(
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+async def delete_all_documents(
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
 ):
     # 1️⃣ Delete all vectors
-    vector_store = get_vector_store(current_user.id)
-    vector_store.delete_collection()
+    vector_store = await run_in_threadpool(get_vector_store, current_user.id)
+    await run_in_threadpool(vector_store.delete_collection)
 
     # 2️⃣ Delete all metadata
-    db.query(Document).filter(
-        Document.user_id == current_user.id
-    ).delete()
+    await db.execute(
+        delete(Document).where(Document.user_id == current_user.id)
+    )
 
-    db.commit()
+    await db.commit()
 
     return {
         "message": "All user documents deleted (vectors + metadata)"
@@ -1,74 +1,260 @@
 # api/routes.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+from pydantic import ValidationError
 
-from db.database import SessionLocal
+from db.database import get_async_db
 # Import the User model to get current_user.id
 from models.user import User as UserModel 
 from models.task import Task
-from models.schemas import TaskCreate, TaskResponse, TaskUpdate
-from api.auth_helpers import get_current_user  # current-user helper
+from models.schemas import (
+    TaskBulkDelete,
+    TaskBulkRequest,
+    TaskBulkResponse,
+    TaskBulkUpdateItem,
+    TaskCreate,
+    TaskResponse,
+    TaskUpdate,
+)
+from api.auth_helpers import get_current_user_async  # current-user helper
+from core.pagination import NEXT_CURSOR_HEADER, decode_offset, encode_offset, keyset, split_page
+from core.task_search import search_statement, search_terms
 
 router = APIRouter(tags=["tasks"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ----------------------------------------------------------------------
 # 1. CREATE TASK (POST) - SECURED AND USER-SPECIFIC
 # ----------------------------------------------------------------------
 @router.post("/tasks", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
-def create_task(
+async def create_task(
     payload: TaskCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     # Dependency runs first: checks JWT and returns the User object
-    current_user: UserModel = Depends(get_current_user), 
+    current_user: UserModel = Depends(get_current_user_async), 
 ):
     # CRITICAL: Link the new task to the authenticated user's ID
     new = Task(**payload.dict(), user_id=current_user.id)
     db.add(new)
-    db.commit()
-    db.refresh(new)
+    await db.commit()
+    await db.refresh(new)
     return new
 
 # ----------------------------------------------------------------------
 # 2. LIST TASKS (GET /tasks) - SECURED AND USER-SPECIFIC
 # ----------------------------------------------------------------------
 @router.get("/tasks", response_model=List[TaskResponse])
-def list_tasks(
-    db: Session = Depends(get_db), 
-    current_user: UserModel = Depends(get_current_user),
-    limit: int = 10, 
-    offset: int = 0
+async def list_tasks(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: UserModel = Depends(get_current_user_async),
+    limit: int = Query(10, ge=1, le=100), 
+    offset: int = 0,
+    cursor: str | None = None,
 ):
     # CRITICAL: Filter tasks by the authenticated user's ID
-    return (
-        db.query(Task)
-        .filter(Task.user_id == current_user.id)
-        .order_by(Task.id.desc())
-        .limit(limit)
+    # Newest first; pass the X-Next-Cursor header back as ?cursor= for the next page
+    stmt = keyset(
+        select(Task).where(Task.user_id == current_user.id),
+        Task.created_at,
+        Task.id,
+        cursor,
+        limit,
+        db.bind.dialect.name,
+    )
+    if offset and not cursor:
+        # Deprecated: OFFSET still reads every skipped row
+        stmt = stmt.offset(offset)
+
+    tasks, next_page = split_page((await db.scalars(stmt)).all(), limit)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
+    return tasks
+
+# ----------------------------------------------------------------------
+# 2.5 SEARCH TASKS (GET /tasks/search) - FULL-TEXT, RANKED
+# ----------------------------------------------------------------------
+# Declared before /tasks/{task_id} so "search" is not parsed as an id
+@router.get("/tasks/search", response_model=List[TaskResponse])
+async def search_tasks(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_user_async),
+):
+    # Best match first; pass X-Next-Cursor back as ?cursor= for the next page
+    terms = search_terms(q)
+    if not terms:
+        return []
+
+    offset = decode_offset(cursor)
+    stmt = (
+        search_statement(db.bind.dialect.name, current_user.id, terms)
         .offset(offset)
-        .all()
+        .limit(limit + 1)
+    )
+    tasks = (await db.scalars(stmt)).all()
+    if len(tasks) > limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_offset(offset + limit)
+    return tasks[:limit]
+
+# ----------------------------------------------------------------------
+# 2.6 BULK CREATE / UPDATE / DELETE - ONE TRANSACTION, PER-ITEM RESULTS
+# ----------------------------------------------------------------------
+# For integrations syncing many tasks: one auth lookup, one session and
+# one commit per request. Invalid or unknown items are reported in their
+# result and skipped; the valid ones are applied together.
+def _item_error(index: int, status_code: int, error, task_id: int | None = None) -> dict:
+    if isinstance(error, ValidationError):
+        error = error.errors(include_url=False, include_context=False)
+    return {"index": index, "status": status_code, "id": task_id, "error": error}
+
+
+def _bulk_response(results: list) -> dict:
+    failed = sum(1 for r in results if r["status"] >= 400)
+    return {"succeeded": len(results) - failed, "failed": failed, "results": results}
+
+
+@router.post("/tasks/bulk", response_model=TaskBulkResponse)
+async def bulk_create_tasks(
+    payload: TaskBulkRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_user_async),
+):
+    results = [None] * len(payload.items)
+    rows, positions = [], []
+    for index, item in enumerate(payload.items):
+        try:
+            task = TaskCreate.model_validate(item)
+        except ValidationError as e:
+            results[index] = _item_error(index, 422, e)
+            continue
+        rows.append({**task.dict(), "user_id": current_user.id})
+        positions.append(index)
+
+    if rows:
+        # One multi-row INSERT ... RETURNING, rows back in input order
+        created = (
+            await db.scalars(
+                insert(Task).returning(Task, sort_by_parameter_order=True),
+                rows,
+            )
+        ).all()
+        await db.commit()
+        for index, task in zip(positions, created):
+            results[index] = {"index": index, "status": 201, "id": task.id, "task": task}
+
+    return _bulk_response(results)
+
+
+@router.put("/tasks/bulk", response_model=TaskBulkResponse)
+async def bulk_update_tasks(
+    payload: TaskBulkRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_user_async),
+):
+    results = [None] * len(payload.items)
+    valid = []
+    for index, item in enumerate(payload.items):
+        try:
+            valid.append((index, TaskBulkUpdateItem.model_validate(item)))
+        except ValidationError as e:
+            task_id = item.get("id")
+            results[index] = _item_error(index, 422, e, task_id if isinstance(task_id, int) else None)
+
+    # CRITICAL: only the caller's tasks; others are reported as not found
+    current = {}
+    if valid:
+        rows = await db.execute(
+            select(Task.id, Task.title, Task.description, Task.status).where(
+                Task.id.in_({item.id for _, item in valid}),
+                Task.user_id == current_user.id,
+            )
+        )
+        current = {row.id: dict(row._mapping) for row in rows}
+
+    # Items for the same task apply in order, as sequential PUTs would
+    changes = {}
+    for index, item in valid:
+        state = current.get(item.id)
+        if state is None:
+            results[index] = _item_error(index, 404, "Task not found", item.id)
+            continue
+
+        values = {}
+        if item.title is not None:
+            values["title"] = item.title.strip()
+        if item.description is not None:
+            values["description"] = item.description
+        if item.status is not None:
+            values["status"] = item.status.value
+
+        state.update(values)
+        changes.setdefault(item.id, {"id": item.id}).update(values)
+        results[index] = {"index": index, "status": 200, "id": item.id, "task": dict(state)}
+
+    updates = [values for values in changes.values() if len(values) > 1]
+    if updates:
+        # ORM bulk UPDATE by primary key (executemany)
+        await db.execute(update(Task), updates)
+        await db.commit()
+
+    return _bulk_response(results)
+
+
+@router.post("/tasks/bulk-delete", response_model=TaskBulkResponse)
+async def bulk_delete_tasks(
+    payload: TaskBulkDelete,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_user_async),
+):
+    # CRITICAL: only the caller's tasks are deleted
+    owned = set(
+        await db.scalars(
+            select(Task.id).where(
+                Task.id.in_(set(payload.ids)),
+                Task.user_id == current_user.id,
+            )
+        )
     )
+    if owned:
+        await db.execute(
+            delete(Task)
+            .where(Task.id.in_(owned))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    results = []
+    deleted = set()
+    for index, task_id in enumerate(payload.ids):
+        # A repeated id is gone by its second occurrence
+        if task_id in owned and task_id not in deleted:
+            deleted.add(task_id)
+            results.append({"index": index, "status": 204, "id": task_id})
+        else:
+            results.append(_item_error(index, 404, "Task not found", task_id))
+
+    return _bulk_response(results)
 
 # ----------------------------------------------------------------------
 # 3. GET SINGLE TASK (GET /tasks/{id}) - SECURED AND USER-SPECIFIC
 # ----------------------------------------------------------------------
 @router.get("/tasks/{task_id}", response_model=TaskResponse)
-def get_task(
+async def get_task(
     task_id: int, 
-    db: Session = Depends(get_db), 
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: UserModel = Depends(get_current_user_async)
 ):
     # CRITICAL: Filter by both Task ID AND User ID
-    t = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+    t = await db.scalar(
+        select(Task).where(Task.id == task_id, Task.user_id == current_user.id)
+    )
     
     # 404 is used to hide the existence of tasks belonging to other users
     if not t:
@@ -79,14 +265,16 @@ def get_task(
 # 4. UPDATE TASK (PUT) - SECURED AND USER-SPECIFIC
 # ----------------------------------------------------------------------
 @router.put("/tasks/{task_id}", response_model=TaskResponse)
-def update_task(
+async def update_task(
     task_id: int, 
     payload: TaskUpdate, 
-    db: Session = Depends(get_db), 
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: UserModel = Depends(get_current_user_async)
 ):
     # CRITICAL: Filter by both Task ID AND User ID
-    t = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+    t = await db.scalar(
+        select(Task).where(Task.id == task_id, Task.user_id == current_user.id)
+    )
     
     if not t:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -100,25 +288,27 @@ def update_task(
         # Pydantic enum value is extracted correctly
         t.status = payload.status.value 
         
-    db.commit()
-    db.refresh(t)
+    await db.commit()
+    await db.refresh(t)
     return t
 
 # ----------------------------------------------------------------------
 # 5. DELETE TASK (DELETE) - SECURED AND USER-SPECIFIC
 # ----------------------------------------------------------------------
 @router.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_task(
+async def delete_task(
     task_id: int, 
-    db: Session = Depends(get_db), 
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: UserModel = Depends(get_current_user_async)
 ):
     # CRITICAL: Filter by both Task ID AND User ID
-    t = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+    t = await db.scalar(
+        select(Task).where(Task.id == task_id, Task.user_id == current_user.id)
+    )
     
     if not t:
         raise HTTPException(status_code=404, detail="Task not found")
         
-    db.delete(t)
-    db.commit()
+    await db.delete(t)
+    await db.commit()
     return
\ No newline at end of file
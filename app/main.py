@@ -25,9 +25,10 @@ load_dotenv(DOTENV_PATH)
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 import logging
+import time
 
 # Imports MUST be AFTER load_dotenv()
-from db.database import Base, engine 
+from db.database import Base, engine, SessionLocal, async_engine
 import models.task  # ensure task metadata registered
 import models.user  # ensure user metadata registered
 from api.routes import router as tasks_router
@@ -36,14 +37,44 @@ from api import agent
 from api import documents
 from api.admin import router as admin_router
 import models
+from core.stage_timer import StageTimings, activate_timings, deactivate_timings
+from core.metrics import HTTP_REQUEST_SECONDS, render_metrics
+from agent.audit_writer import audit_writer
+from agent.execution_limits import seed_run_limits
+from agent.retention import retention
+from contextlib import asynccontextmanager
+from fastapi.responses import PlainTextResponse
 
 
 
 # Define the OAuth2 scheme (tells FastAPI where the token is obtained)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token") 
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the run limiter from the runs already in the window
+    db = SessionLocal()
+    try:
+        seed_run_limits(db)
+    finally:
+        db.close()
+
+    # Background writer for agent audit rows; drained on shutdown
+    audit_writer.start()
+    # Scheduled + on-demand deletion of old agent history
+    retention.start()
+    try:
+        yield
+    finally:
+        retention.stop()
+        audit_writer.stop()
+        await async_engine.dispose()
+
+
 app = FastAPI(
     title="Task AI Manager",
+    lifespan=lifespan,
     # CRITICAL: This block adds the security method to the OpenAPI specification (Swagger UI)
     openapi_extra={
         "securitySchemes": {
@@ -68,6 +99,59 @@ app.include_router(admin_router)
 
 
 
+# ------------------------------------------------
+# METRICS (Prometheus text format at /metrics)
+# ------------------------------------------------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+if METRICS_ENABLED:
+
+    @app.middleware("http")
+    async def request_metrics(request: Request, call_next):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Route template, not the raw path, to keep label cardinality bounded
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=request.method,
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# ------------------------------------------------
+# STAGE TIMINGS (Server-Timing header, used by bench/)
+# ------------------------------------------------
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+if SERVER_TIMING_ENABLED:
+
+    @app.middleware("http")
+    async def server_timing(request: Request, call_next):
+        timings = StageTimings()
+        token = activate_timings(timings)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            deactivate_timings(token)
+
+        # Streamed bodies keep running after the headers are sent
+        timings.add("app", (time.perf_counter() - started) * 1000)
+        response.headers["Server-Timing"] = timings.server_timing()
+        return response
+
+
 
 # basic logging
 logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,130 @@
+# bench/auth_bench.py
+"""
+Per-request authentication overhead, with and without the user cache.
+
+    python -m bench.auth_bench
+    python -m bench.auth_bench --requests 2000 --concurrency 16
+
+Starts the API twice on the same throwaway SQLite database, once with
+AUTH_USER_CACHE_TTL_SECONDS=0 (every request loads the user) and once
+with the cache on, and sends authenticated GET /tasks requests to each.
+Reports the "auth" stage from the Server-Timing header next to the total
+client latency, so the difference is the cost of resolving the token.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from bench.run_bench import (
+    _create_schema,
+    _spawn,
+    _wait_until_up,
+    create_users,
+    parse_server_timing,
+    summarize,
+)
+
+
+MODES = [
+    ("uncached", "0"),
+    ("cached", None),  # API default TTL
+]
+
+
+def measure(api_url: str, users: list, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    with httpx.Client(base_url=api_url, limits=limits, timeout=30.0) as client:
+        def one(n: int) -> tuple:
+            _, token = users[n % len(users)]
+            started = time.perf_counter()
+            response = client.get("/tasks", headers={"Authorization": f"Bearer {token}"})
+            latency_ms = (time.perf_counter() - started) * 1000
+            stages = parse_server_timing(response.headers.get("server-timing", ""))
+            return response.status_code, latency_ms, stages.get("auth")
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(one, range(args.warmup)))
+
+            started = time.perf_counter()
+            samples = list(pool.map(one, range(args.requests)))
+            elapsed = time.perf_counter() - started
+
+    ok = [s for s in samples if s[0] == 200]
+    return {
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize([s[1] for s in ok]),
+        "auth_ms": summarize([s[2] for s in ok if s[2] is not None]),
+    }
+
+
+def run_mode(ttl: str | None, workdir: str, args) -> dict:
+    env = dict(os.environ)
+    env.update(
+        {
+            "DATABASE_URL": f"sqlite:///{workdir}/auth_bench.db",
+            "SERVER_TIMING_ENABLED": "true",
+            # /tasks never calls the LLM; the stub backend just needs no API key
+            "LLM_BACKEND": "stub",
+        }
+    )
+    if ttl is not None:
+        env["AUTH_USER_CACHE_TTL_SECONDS"] = ttl
+    else:
+        env.pop("AUTH_USER_CACHE_TTL_SECONDS", None)
+
+    api = _spawn("app.main:app", args.api_port, env)
+    try:
+        api_url = f"http://127.0.0.1:{args.api_port}"
+        _wait_until_up(api_url + "/")
+        with httpx.Client(base_url=api_url, timeout=30.0) as client:
+            users = create_users(client, args.users)
+        return measure(api_url, users, args)
+    finally:
+        api.terminate()
+        api.wait(timeout=30)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--api-port", type=int, default=8812)
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="auth_bench_") as workdir:
+        _create_schema(f"sqlite:///{workdir}/auth_bench.db")
+        for name, ttl in MODES:
+            results[name] = run_mode(ttl, workdir, args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"\n{'mode':<10}{'auth p50':>10}{'auth p95':>10}{'auth mean':>11}{'req p50':>10}{'req p95':>10}{'rps':>9}")
+    for name, r in results.items():
+        auth, latency = r["auth_ms"], r["latency_ms"]
+        if not auth.get("count"):
+            print(f"{name:<10}  no successful requests ({r['errors']} errors)")
+            continue
+        print(
+            f"{name:<10}{auth['p50']:>10.3f}{auth['p95']:>10.3f}{auth['mean']:>11.3f}"
+            f"{latency['p50']:>10.2f}{latency['p95']:>10.2f}{r['throughput_rps']:>9.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+# bench/bulk_bench.py
+"""
+Task write throughput: single-item endpoints vs the bulk endpoints.
+
+    python -m bench.bulk_bench
+    python -m bench.bulk_bench --items 5000 --batch 500 --concurrency 8
+
+Starts the API on a throwaway SQLite database and pushes the same
+--items tasks through each path, one operation at a time:
+
+    single: POST /tasks, PUT /tasks/{id}, DELETE /tasks/{id}   (--concurrency clients)
+    bulk:   POST /tasks/bulk, PUT /tasks/bulk, POST /tasks/bulk-delete
+            (--batch items per request, sent sequentially)
+
+and reports items/sec per operation and the speedup. Every single-item
+request pays its own auth lookup, session and commit; a bulk request
+pays them once per batch.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from bench.run_bench import _create_schema, _spawn, _wait_until_up, create_users
+
+
+OPERATIONS = ["create", "update", "delete"]
+
+
+def _failed(response: httpx.Response, batch: list) -> int:
+    """Items of a bulk request that were not applied."""
+    if response.status_code != 200:
+        return len(batch)
+    return response.json()["failed"]
+
+
+def run_single(client: httpx.Client, headers: dict, args) -> dict:
+    results = {}
+
+    def timed(fn, items):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            started = time.perf_counter()
+            outcomes = list(pool.map(fn, items))
+            return time.perf_counter() - started, outcomes
+
+    elapsed, created = timed(
+        lambda n: client.post("/tasks", json={"title": f"single task {n}", "description": "synced"}, headers=headers),
+        range(args.items),
+    )
+    ids = [r.json()["id"] for r in created if r.status_code == 201]
+    results["create"] = (elapsed, args.items - len(ids))
+
+    elapsed, updated = timed(
+        lambda task_id: client.put(f"/tasks/{task_id}", json={"status": "done"}, headers=headers),
+        ids,
+    )
+    results["update"] = (elapsed, sum(r.status_code != 200 for r in updated))
+
+    elapsed, deleted = timed(
+        lambda task_id: client.delete(f"/tasks/{task_id}", headers=headers),
+        ids,
+    )
+    results["delete"] = (elapsed, sum(r.status_code != 204 for r in deleted))
+    return results
+
+
+def run_bulk(client: httpx.Client, headers: dict, args) -> dict:
+    results = {}
+    batches = [range(start, min(start + args.batch, args.items)) for start in range(0, args.items, args.batch)]
+
+    ids, failed = [], 0
+    started = time.perf_counter()
+    for batch in batches:
+        response = client.post(
+            "/tasks/bulk",
+            json={"items": [{"title": f"bulk task {n}", "description": "synced"} for n in batch]},
+            headers=headers,
+        )
+        failed += _failed(response, batch)
+        if response.status_code == 200:
+            ids.extend(r["id"] for r in response.json()["results"] if r["status"] == 201)
+    results["create"] = (time.perf_counter() - started, failed)
+
+    id_batches = [ids[start:start + args.batch] for start in range(0, len(ids), args.batch)]
+
+    failed = 0
+    started = time.perf_counter()
+    for batch in id_batches:
+        response = client.put(
+            "/tasks/bulk",
+            json={"items": [{"id": task_id, "status": "done"} for task_id in batch]},
+            headers=headers,
+        )
+        failed += _failed(response, batch)
+    results["update"] = (time.perf_counter() - started, failed)
+
+    failed = 0
+    started = time.perf_counter()
+    for batch in id_batches:
+        response = client.post("/tasks/bulk-delete", json={"ids": batch}, headers=headers)
+        failed += _failed(response, batch)
+    results["delete"] = (time.perf_counter() - started, failed)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=500, help="items per bulk request (max 1000)")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients for the single-item path")
+    parser.add_argument("--api-port", type=int, default=8813)
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bulk_bench_") as workdir:
+        database_url = f"sqlite:///{workdir}/bulk_bench.db"
+        _create_schema(database_url)
+
+        env = dict(os.environ)
+        # Task endpoints never call the LLM; the stub backend just needs no API key
+        env.update({"DATABASE_URL": database_url, "LLM_BACKEND": "stub"})
+        api = _spawn("app.main:app", args.api_port, env)
+        try:
+            api_url = f"http://127.0.0.1:{args.api_port}"
+            _wait_until_up(api_url + "/")
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            with httpx.Client(base_url=api_url, limits=limits, timeout=120.0) as client:
+                (_, token), = create_users(client, 1)
+                headers = {"Authorization": f"Bearer {token}"}
+                raw = {
+                    "single": run_single(client, headers, args),
+                    "bulk": run_bulk(client, headers, args),
+                }
+        finally:
+            api.terminate()
+            api.wait(timeout=30)
+
+    results = {
+        mode: {
+            op: {
+                "seconds": round(elapsed, 3),
+                "items_per_second": round(args.items / elapsed, 1) if elapsed else 0.0,
+                "failed": failed,
+            }
+            for op, (elapsed, failed) in ops.items()
+        }
+        for mode, ops in raw.items()
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"\n{args.items} items, bulk batches of {args.batch}, {args.concurrency} single-item clients")
+    print(f"{'operation':<11}{'single/s':>11}{'bulk/s':>11}{'speedup':>9}{'failed':>9}")
+    for op in OPERATIONS:
+        single, bulk = results["single"][op], results["bulk"][op]
+        speedup = bulk["items_per_second"] / single["items_per_second"] if single["items_per_second"] else 0.0
+        print(
+            f"{op:<11}{single['items_per_second']:>11.1f}{bulk['items_per_second']:>11.1f}"
+            f"{speedup:>8.1f}x{single['failed'] + bulk['failed']:>9}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,227 @@
+# bench/llm_stub.py
+"""
+Deterministic OpenAI/Groq-compatible LLM stub for benchmarks and load tests.
+
+    uvicorn bench.llm_stub:app --port 8900
+    LLM_BACKEND=stub uvicorn app.main:app
+
+Serves POST /openai/v1/chat/completions (plain and streaming) with canned
+intents, plans and answers chosen from the X-LLM-Call-Site header that
+agent/llm_client.py sends. Latency, token rate and error rate are set with
+the STUB_* env vars below or at runtime via PUT /stub/config.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+import zlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+config = {
+    # Time to first token: lognormal around the median
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", "200")),
+    "latency_sigma": float(os.getenv("STUB_LATENCY_SIGMA", "0.35")),
+    # Generation speed for the answer body (0 = instant)
+    "tokens_per_second": float(os.getenv("STUB_TOKENS_PER_SECOND", "400")),
+    "answer_tokens": int(os.getenv("STUB_ANSWER_TOKENS", "120")),
+    # Fraction of requests answered with 503 + retry-after-ms
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+    "seed": int(os.getenv("STUB_SEED", "42")),
+}
+
+_rng = random.Random(config["seed"])
+_stats = {"requests": 0, "errors": 0, "streams": 0}
+
+DOC_KEYWORDS = ["document", "resume", "pdf", "uploaded", "file"]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# ------------------------------------------------
+# CANNED RESPONSES
+# ------------------------------------------------
+def _user_text(messages: list) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
+
+
+def _classify(text: str) -> dict:
+    lowered = text.lower()
+
+    if "task" in lowered and any(w in lowered for w in ("create", "add", "remind")):
+        return {
+            "intent": "CREATE_TASK",
+            "task": {"title": text.strip()[:80], "description": None},
+        }
+    if "task" in lowered and any(w in lowered for w in ("list", "show", "my tasks")):
+        return {"intent": "LIST_TASKS"}
+    if any(k in lowered for k in DOC_KEYWORDS):
+        return {"intent": "ASK_DOC"}
+    return {"intent": "ANSWER"}
+
+
+def _plan(text: str) -> list:
+    intent = _classify(text)["intent"]
+
+    if intent == "CREATE_TASK":
+        return [{"tool": "create_task", "args": {"title": text.strip()[:80]}}]
+    if intent == "LIST_TASKS":
+        return [{"tool": "get_tasks", "args": {}}]
+    if intent == "ASK_DOC":
+        return [
+            {"tool": "retrieve_context", "args": {}},
+            {"tool": "generate_answer", "args": {}},
+        ]
+    return [{"tool": "generate_answer", "args": {}}]
+
+
+def _answer(text: str, max_tokens: int | None) -> list:
+    n = config["answer_tokens"]
+    if max_tokens:
+        n = min(n, max_tokens)
+    seed = zlib.crc32(text.encode()) % 997
+    return [f"word{(seed + i) % 97} " for i in range(n)]
+
+
+def _completion_pieces(call_site: str, body: dict) -> list:
+    text = _user_text(body.get("messages", []))
+
+    if call_site == "intent_classifier":
+        return [json.dumps(_classify(text))]
+    if call_site == "planner":
+        return [json.dumps(_plan(text))]
+    return _answer(text, body.get("max_tokens"))
+
+
+# ------------------------------------------------
+# TIMING / FAILURES
+# ------------------------------------------------
+def _first_token_delay() -> float:
+    median = config["latency_ms"] / 1000
+    if median <= 0:
+        return 0.0
+    return median * math.exp(_rng.gauss(0, config["latency_sigma"]))
+
+
+def _token_delay() -> float:
+    rate = config["tokens_per_second"]
+    return 1 / rate if rate > 0 else 0.0
+
+
+def _usage(body: dict, completion: str) -> dict:
+    prompt_tokens = sum(_tokens(m.get("content") or "") for m in body.get("messages", []))
+    completion_tokens = _tokens(completion)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+# ------------------------------------------------
+# APP
+# ------------------------------------------------
+app = FastAPI(title="LLM stub")
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    call_site = request.headers.get("x-llm-call-site", "generate_answer")
+    _stats["requests"] += 1
+
+    await asyncio.sleep(_first_token_delay())
+
+    if _rng.random() < config["error_rate"]:
+        _stats["errors"] += 1
+        return JSONResponse(
+            status_code=503,
+            content={"error": {"message": "stub overloaded", "type": "server_error"}},
+            headers={"retry-after-ms": "50"},
+        )
+
+    pieces = _completion_pieces(call_site, body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "stub")
+
+    if not body.get("stream"):
+        # Non-streamed answers still pay for generation time
+        if call_site == "generate_answer":
+            await asyncio.sleep(_token_delay() * len(pieces))
+        content = "".join(pieces)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": _usage(body, content),
+        }
+
+    _stats["streams"] += 1
+
+    def chunk(delta: dict, finish_reason=None, usage=None) -> str:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            # Groq reports usage under x_groq on the final chunk
+            data["x_groq"] = {"id": completion_id, "usage": usage}
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for piece in pieces:
+            await asyncio.sleep(_token_delay())
+            yield chunk({"content": piece})
+        yield chunk({}, finish_reason="stop", usage=_usage(body, "".join(pieces)))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stub/config")
+def get_config():
+    return {"config": config, "stats": _stats}
+
+
+@app.put("/stub/config")
+def update_config(changes: dict):
+    global _rng
+
+    unknown = set(changes) - set(config)
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"Unknown keys: {sorted(unknown)}"})
+
+    for key, value in changes.items():
+        config[key] = type(config[key])(value)
+
+    if "seed" in changes:
+        _rng = random.Random(config["seed"])
+
+    return {"config": config}
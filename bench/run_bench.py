@@ -0,0 +1,485 @@
+# bench/run_bench.py
+"""
+End-to-end latency benchmark for POST /agent/run.
+
+    python -m bench.run_bench
+    python -m bench.run_bench --concurrency 32 --requests 500
+    python -m bench.run_bench --compare bench/results/<baseline>.json
+    python -m bench.run_bench --url http://127.0.0.1:8000   # already running API
+
+By default it starts the LLM stub (bench/llm_stub.py) and the API with
+uvicorn against a throwaway SQLite database, seeds bench/documents.jsonl
+into each bench user's Chroma collection, then replays bench/prompts.jsonl
+at the requested concurrency. Per-stage timings come from the API's
+Server-Timing header (SERVER_TIMING_ENABLED=true). Results are written to
+bench/results/<git sha>.json for comparison between commits.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+# Stages reported by the API, in pipeline order
+STAGES = [
+    "auth",
+    "rate_limit",
+    "classifier",
+    "planner",
+    "retrieval",
+    "tools",
+    "answer",
+    "db_write",
+    "app",
+]
+
+
+# ------------------------------------------------
+# STATS
+# ------------------------------------------------
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2),
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(max(values), 2),
+    }
+
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = float(value)
+    return stages
+
+
+# ------------------------------------------------
+# ENVIRONMENT (STUB + API SUBPROCESSES)
+# ------------------------------------------------
+def _wait_until_up(url: str, timeout: float = 60.0) -> None:
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def _spawn(module_app: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", module_app,
+            "--port", str(port),
+            "--log-level", "warning",
+        ],
+        cwd=PROJECT_ROOT,
+        env=env,
+    )
+
+
+def start_environment(args, workdir: str) -> tuple[str, dict, list]:
+    """Start stub + API. Returns (api_url, api_env, processes)."""
+    env = dict(os.environ)
+    env.update(
+        {
+            "STUB_LATENCY_MS": str(args.llm_latency_ms),
+            "STUB_LATENCY_SIGMA": str(args.llm_latency_sigma),
+            "STUB_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+            "STUB_ERROR_RATE": str(args.llm_error_rate),
+            "STUB_SEED": str(args.seed),
+        }
+    )
+    stub = _spawn("bench.llm_stub:app", args.stub_port, env)
+
+    api_env = dict(env)
+    api_env.update(
+        {
+            "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+            "LLM_BACKEND": "stub",
+            "LLM_STUB_URL": f"http://127.0.0.1:{args.stub_port}",
+            "SERVER_TIMING_ENABLED": "true",
+            "VECTOR_NAMESPACE": f"bench_{uuid.uuid4().hex[:8]}",
+            "AGENT_MAX_RUNS": "1000000",
+            "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        }
+    )
+    _create_schema(api_env["DATABASE_URL"])
+    api = _spawn("app.main:app", args.api_port, api_env)
+
+    _wait_until_up(f"http://127.0.0.1:{args.stub_port}/stub/config")
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    _wait_until_up(api_url + "/")
+    return api_url, api_env, [api, stub]
+
+
+def _create_schema(database_url: str) -> None:
+    # Fresh database for every run; same tables the migrations produce
+    subprocess.run(
+        [
+            sys.executable, "-c",
+            "from db.database import Base, engine; import models; "
+            "Base.metadata.create_all(engine)",
+        ],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, "DATABASE_URL": database_url},
+        check=True,
+    )
+
+
+def seed_documents(user_ids: list, api_env: dict) -> None:
+    """Embed the document corpus into each bench user's collection."""
+    texts = [json.loads(line)["text"] for line in open(BENCH_DIR / "documents.jsonl")]
+
+    # Same namespace + persist dir the API process uses
+    os.environ["VECTOR_NAMESPACE"] = api_env["VECTOR_NAMESPACE"]
+    os.chdir(PROJECT_ROOT)
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from rag.vector_store import get_vector_store
+
+    for user_id in user_ids:
+        get_vector_store(user_id).add_texts(
+            texts, metadatas=[{"doc_id": "bench"} for _ in texts]
+        )
+
+
+def _grant_admin(database_url: str, user_id: int) -> None:
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE users SET role = 'admin' WHERE id = :id"), {"id": user_id})
+    engine.dispose()
+
+
+def create_users(client: httpx.Client, count: int, admin_database_url: str | None = None) -> list:
+    """
+    Register bench users. Returns [(user_id, token)].
+
+    With admin_database_url (the bench's own database) users are made
+    admins before their token is issued: create_task is admin-only
+    (agent/tool_permissions.py) and the prompt corpus exercises it.
+    """
+    users = []
+    suffix = uuid.uuid4().hex[:8]
+    for n in range(count):
+        email = f"bench{n}_{suffix}@example.com"
+        password = "bench-password"
+        registered = client.post("/auth/register", json={"email": email, "password": password})
+        registered.raise_for_status()
+        if admin_database_url:
+            _grant_admin(admin_database_url, registered.json()["id"])
+        token = client.post("/auth/token", data={"username": email, "password": password})
+        token.raise_for_status()
+        users.append((registered.json()["id"], token.json()["access_token"]))
+    return users
+
+
+# ------------------------------------------------
+# LOAD
+# ------------------------------------------------
+def load_prompts(path: Path, total: int, verbatim: bool, skip_kinds: tuple = ()) -> list:
+    corpus = [json.loads(line) for line in open(path) if line.strip()]
+    corpus = [item for item in corpus if item.get("kind", "answer") not in skip_kinds]
+    prompts = []
+    for n in range(total):
+        item = corpus[n % len(corpus)]
+        prompt = item["prompt"]
+        if not verbatim:
+            # Identical in-flight prompts are coalesced by the engine
+            prompt = f"{prompt} (#{n})"
+        prompts.append({"kind": item.get("kind", "answer"), "prompt": prompt})
+    return prompts
+
+
+def send(client: httpx.Client, token: str, prompt: dict, fresh: bool) -> dict:
+    started = time.perf_counter()
+    try:
+        response = client.post(
+            "/agent/run",
+            params={"prompt": prompt["prompt"], "fresh": fresh},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        latency_ms = (time.perf_counter() - started) * 1000
+        body = response.json()
+        ok = response.status_code == 200 and "error" not in body
+        error = None if ok else str(body.get("error") or body.get("detail") or response.status_code)
+        stages = parse_server_timing(response.headers.get("server-timing", ""))
+    except httpx.HTTPError as e:
+        latency_ms = (time.perf_counter() - started) * 1000
+        ok, error, stages = False, type(e).__name__, {}
+
+    return {
+        "kind": prompt["kind"],
+        "latency_ms": latency_ms,
+        "ok": ok,
+        "error": error,
+        "stages": stages,
+    }
+
+
+def run_load(api_url: str, users: list, warmup: list, prompts: list, args) -> tuple[list, float]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    with httpx.Client(base_url=api_url, limits=limits, timeout=args.timeout) as client:
+        def replay(batch: list) -> list:
+            def one(n: int) -> dict:
+                _, token = users[n % len(users)]
+                return send(client, token, batch[n], args.fresh)
+
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                return list(pool.map(one, range(len(batch))))
+
+        # Warm-up (connections, model loading) is not measured
+        replay(warmup)
+
+        started = time.perf_counter()
+        samples = replay(prompts)
+        elapsed = time.perf_counter() - started
+
+    return samples, elapsed
+
+
+def build_report(samples: list, elapsed: float, args) -> dict:
+    ok = [s for s in samples if s["ok"]]
+    errors = {}
+    for s in samples:
+        if not s["ok"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+
+    stages = {}
+    for name in STAGES:
+        values = [s["stages"][name] for s in ok if name in s["stages"]]
+        if values:
+            stages[name] = summarize(values)
+
+    by_kind = {}
+    for kind in sorted({s["kind"] for s in ok}):
+        by_kind[kind] = summarize([s["latency_ms"] for s in ok if s["kind"] == kind])
+
+    return {
+        "meta": {
+            "git_sha": git_sha(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "config": {
+                "requests": len(samples),
+                "concurrency": args.concurrency,
+                "users": args.users,
+                "llm_latency_ms": args.llm_latency_ms,
+                "llm_latency_sigma": args.llm_latency_sigma,
+                "llm_tokens_per_second": args.llm_tokens_per_second,
+                "llm_error_rate": args.llm_error_rate,
+                "answer_cache": args.answer_cache,
+                "fresh": args.fresh,
+                "verbatim": args.verbatim,
+            },
+        },
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "duration_s": round(elapsed, 2),
+        "ok": len(ok),
+        "errors": errors,
+        "latency_ms": summarize([s["latency_ms"] for s in ok]),
+        "by_kind": by_kind,
+        "stages_ms": stages,
+    }
+
+
+# ------------------------------------------------
+# RESULTS / COMPARISON
+# ------------------------------------------------
+def git_sha() -> str:
+    try:
+        sha = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True,
+        ).stdout.strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_report(report: dict, label: str | None) -> Path:
+    RESULTS_DIR.mkdir(exist_ok=True)
+    name = report["meta"]["git_sha"]
+    if label:
+        name = f"{name}-{label}"
+    path = RESULTS_DIR / f"{name}.json"
+    path.write_text(json.dumps(report, indent=2))
+    return path
+
+
+def print_report(report: dict) -> None:
+    latency = report["latency_ms"]
+    print(f"\nrequests: {report['meta']['config']['requests']}  ok: {report['ok']}  "
+          f"errors: {sum(report['errors'].values())}  "
+          f"throughput: {report['throughput_rps']} req/s")
+    for error, count in report["errors"].items():
+        print(f"  {count:>5} x {error}")
+
+    print(f"\n{'stage':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}")
+    rows = [("total", latency)] + list(report["stages_ms"].items())
+    for name, s in rows:
+        if s.get("count"):
+            print(f"{name:<12}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['mean']:>10.1f}")
+
+    print(f"\n{'kind':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'count':>10}")
+    for kind, s in report["by_kind"].items():
+        print(f"{kind:<12}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['count']:>10}")
+
+
+def compare(report: dict, baseline: dict, fail_over_pct: float | None) -> bool:
+    """Print deltas against a baseline. Returns False on a p95 regression."""
+    print(f"\ncompared to {baseline['meta']['git_sha']}:")
+    print(f"{'metric':<22}{'baseline':>12}{'current':>12}{'delta':>10}")
+
+    def row(name, old, new):
+        delta = ((new - old) / old * 100) if old else 0.0
+        print(f"{name:<22}{old:>12.1f}{new:>12.1f}{delta:>9.1f}%")
+        return delta
+
+    row("throughput rps", baseline["throughput_rps"], report["throughput_rps"])
+    regressed = False
+    pairs = [("total", baseline["latency_ms"], report["latency_ms"])]
+    pairs += [
+        (name, baseline["stages_ms"][name], s)
+        for name, s in report["stages_ms"].items()
+        if name in baseline["stages_ms"]
+    ]
+    for name, old, new in pairs:
+        for pct in ("p50", "p95", "p99"):
+            delta = row(f"{name} {pct}", old.get(pct, 0.0), new.get(pct, 0.0))
+            if pct == "p95" and fail_over_pct is not None and delta > fail_over_pct:
+                regressed = True
+
+    return not regressed
+
+
+# ------------------------------------------------
+# CLI
+# ------------------------------------------------
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=Path, default=BENCH_DIR / "prompts.jsonl")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="benchmark an already running API instead of spawning one")
+    parser.add_argument("--token", action="append", default=[],
+                        help="bearer token(s) to use with --url (default: register users)")
+    parser.add_argument("--skip-seed", action="store_true", help="do not seed documents")
+    parser.add_argument("--api-port", type=int, default=8811)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.35)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=400)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--fresh", action="store_true", help="send fresh=true (skip answer cache)")
+    parser.add_argument("--verbatim", action="store_true",
+                        help="send corpus prompts unchanged (duplicates may be coalesced)")
+    parser.add_argument("--label", help="suffix for the results file name")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", type=Path, help="baseline results file")
+    parser.add_argument("--fail-over", type=float,
+                        help="exit 1 if any p95 regresses by more than this percent")
+    args = parser.parse_args()
+
+    # Seeding must target the namespace the running API reads from; the
+    # vector store's own default ("prod") is never a safe guess
+    if args.url and not args.skip_seed and not os.environ.get("VECTOR_NAMESPACE"):
+        parser.error("--url seeds documents: set VECTOR_NAMESPACE to the API's namespace, or pass --skip-seed")
+
+    processes = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+            if args.url:
+                api_url, api_env = args.url, dict(os.environ)
+            else:
+                api_url, api_env, processes = start_environment(args, workdir)
+
+            with httpx.Client(base_url=api_url, timeout=args.timeout) as client:
+                if args.token:
+                    users = [(None, token) for token in args.token]
+                else:
+                    users = create_users(
+                        client, args.users, None if args.url else api_env["DATABASE_URL"]
+                    )
+
+            # Users registered against a running API have the "user" role,
+            # which may not create tasks: those prompts would only hit 403
+            skip_kinds = ()
+            if args.url and not args.token:
+                skip_kinds = ("create_task",)
+                print("note: skipping create_task prompts (registered users are not admins; pass --token)")
+
+            if not args.skip_seed and all(user_id is not None for user_id, _ in users):
+                seed_documents([user_id for user_id, _ in users], api_env)
+
+            prompts = load_prompts(
+                args.prompts, args.requests + args.warmup, args.verbatim, skip_kinds
+            )
+            samples, elapsed = run_load(
+                api_url, users, prompts[: args.warmup], prompts[args.warmup :], args
+            )
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = build_report(samples, elapsed, args)
+    print_report(report)
+
+    if not args.no_save:
+        print(f"\nsaved {save_report(report, args.label)}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if not compare(report, baseline, args.fail_over):
+            print(f"\np95 regression above {args.fail_over}%")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
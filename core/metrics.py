@@ -0,0 +1,243 @@
+# core/metrics.py
+"""
+Minimal in-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain locked dicts keyed by label
+values, so observing on the hot path is one lock + a bisect. Values
+that already live elsewhere (cache stats, DB pool) are read at scrape
+time through callback metrics instead of being mirrored.
+"""
+
+import bisect
+import threading
+
+
+# Seconds; covers sub-ms DB work up to slow LLM calls
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ------------------------------------------------
+# METRIC TYPES
+# ------------------------------------------------
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def _header(self) -> list:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts + overflow, sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        lines = self._header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Value(s) computed at scrape time: fn() returns a number, or a dict
+    mapping label-value tuples to numbers.
+    """
+
+    def __init__(self, name: str, documentation: str, fn, kind: str = "gauge", labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._fn = fn
+
+    def render(self) -> list:
+        try:
+            values = self._fn()
+        except Exception:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in values.items()
+        ]
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback(name: str, documentation: str, fn, kind: str = "gauge", labelnames: tuple = ()) -> CallbackMetric:
+    return _register(CallbackMetric(name, documentation, fn, kind, labelnames))
+
+
+def render_metrics() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------
+# HOT-PATH METRICS
+# ------------------------------------------------
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+
+AGENT_STAGE_SECONDS = histogram(
+    "agent_stage_duration_seconds",
+    "Time spent per request stage (auth, classifier, planner, retrieval, answer, db_write, ...)",
+    ("stage",),
+)
+
+AGENT_RUNS_IN_FLIGHT = gauge(
+    "agent_runs_in_flight",
+    "Agent runs currently executing",
+)
+
+LLM_REQUEST_SECONDS = histogram(
+    "llm_request_duration_seconds",
+    "LLM call latency including retries",
+    ("call_site",),
+)
+
+LLM_REQUESTS = counter(
+    "llm_requests_total",
+    "LLM calls by outcome",
+    ("call_site", "outcome"),
+)
+
+LLM_RETRIES = counter(
+    "llm_retries_total",
+    "LLM call retries",
+    ("call_site",),
+)
+
+LLM_TOKENS = counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM",
+    ("call_site", "kind"),
+)
+
+EMBEDDING_SECONDS = histogram(
+    "embedding_duration_seconds",
+    "Embedding call latency",
+    ("operation",),
+)
+
+EMBEDDING_BATCH_SIZE = histogram(
+    "embedding_batch_size",
+    "Texts per embedding call",
+    ("operation",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+CHROMA_QUERY_SECONDS = histogram(
+    "chroma_query_duration_seconds",
+    "Vector store query latency",
+    ("operation",),
+)
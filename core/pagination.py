@@ -0,0 +1,93 @@
+# core/pagination.py
+"""
+Keyset (cursor) pagination over (created_at, id), newest first.
+
+The cursor is the opaque, URL-safe encoding of the last row's
+(created_at, id); the next page is everything strictly before it in
+(created_at DESC, id DESC) order, which an index on
+(..., created_at, id) serves without scanning skipped rows.
+
+Ranked results (search) have no such key; their cursor is an opaque
+offset into the ranking.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import String, literal, tuple_
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor_value(value) -> str:
+    raw = json.dumps(value, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor_value(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    return encode_cursor_value([created_at.isoformat(), row_id])
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, row_id = decode_cursor_value(cursor)
+        return datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _bind_timestamp(value: datetime, dialect: str):
+    if dialect != "sqlite":
+        return value
+    # SQLite compares timestamps as text and server defaults store them
+    # without a fraction: bind the same text, or equal values sort as "less"
+    fmt = "%Y-%m-%d %H:%M:%S" if value.microsecond == 0 else "%Y-%m-%d %H:%M:%S.%f"
+    return literal(value.strftime(fmt), String)
+
+
+def keyset(stmt, created_col, id_col, cursor: str | None, limit: int, dialect: str):
+    """
+    Order stmt newest first and start after the cursor (if any). Fetches
+    one extra row so split_page can tell whether another page exists.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(created_col, id_col) < tuple_(_bind_timestamp(created_at, dialect), row_id)
+        )
+    return stmt.order_by(created_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def split_page(rows: list, limit: int) -> tuple:
+    """(page rows, cursor of the next page or None on the last page)."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(page[-1].created_at, page[-1].id)
+
+
+# ------------------------------------------------
+# RANKED RESULTS (search): no stable key to seek on
+# ------------------------------------------------
+def encode_offset(offset: int) -> str:
+    return encode_cursor_value({"offset": offset})
+
+
+def decode_offset(cursor: str | None) -> int:
+    if not cursor:
+        return 0
+    value = decode_cursor_value(cursor)
+    if not isinstance(value, dict) or not isinstance(value.get("offset"), int) or value["offset"] < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value["offset"]
@@ -1,5 +1,6 @@
 # core/security.py
 from passlib.context import CryptContext
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt
@@ -36,6 +37,7 @@ def create_access_token(subject: str, expires_delta: timedelta, additional_claim
         to_encode.update(additional_claims)
 
     expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
+    # jti identifies this token (per-token auth cache entries)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
 
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -0,0 +1,67 @@
+# core/stage_timer.py
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from core.metrics import AGENT_STAGE_SECONDS
+
+
+# ------------------------------------------------
+# PER-REQUEST STAGE TIMINGS
+# ------------------------------------------------
+class StageTimings:
+    """
+    Wall-clock milliseconds spent per stage (auth, planner, answer, ...)
+    during one request. Plan steps run on worker threads, so updates
+    are locked; a stage entered several times accumulates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, stage: str, ms: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def server_timing(self) -> str:
+        """Value for the standard Server-Timing response header."""
+        with self._lock:
+            return ", ".join(
+                f"{stage};dur={ms:.2f}" for stage, ms in self.stages.items()
+            )
+
+
+_current_timings: ContextVar = ContextVar("stage_timings", default=None)
+
+
+def activate_timings(timings: StageTimings):
+    return _current_timings.set(timings)
+
+
+def deactivate_timings(token) -> None:
+    _current_timings.reset(token)
+
+
+def current_timings() -> StageTimings | None:
+    return _current_timings.get()
+
+
+def record_stage(stage: str, ms: float) -> None:
+    AGENT_STAGE_SECONDS.observe(ms / 1000, stage=stage)
+
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, ms)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as `name` (metrics + request timings, if active)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, (time.perf_counter() - started) * 1000)
@@ -0,0 +1,71 @@
+# core/task_search.py
+"""
+Ranked full-text search over a user's tasks (title + description).
+
+SQLite:   FTS5 table tasks_fts, ranked by bm25 (lower is better).
+Postgres: tasks.search_vector (GIN), ranked by ts_rank_cd.
+Other backends fall back to LIKE with no ranking.
+
+The index itself is defined in models/task.py. User input never reaches
+the MATCH / tsquery syntax directly: it is split into word terms, all
+required, the last one matched as a prefix (search as you type).
+"""
+
+import re
+
+from sqlalchemy import column, func, literal_column, or_, select, table
+
+from models.task import Task
+
+MAX_TERMS = 16
+
+_tasks_fts = table("tasks_fts", column("rowid"))
+
+
+def search_terms(query: str) -> list:
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def _fts5_match(terms: list) -> str:
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _tsquery(terms: list) -> str:
+    return " & ".join(terms[:-1] + [terms[-1] + ":*"])
+
+
+def search_statement(dialect: str, user_id: int, terms: list):
+    """SELECT Task best match first (terms must not be empty)."""
+    if dialect == "sqlite":
+        rank = literal_column("bm25(tasks_fts)")
+        return (
+            select(Task)
+            .join(_tasks_fts, _tasks_fts.c.rowid == Task.id)
+            .where(
+                literal_column("tasks_fts").op("MATCH")(_fts5_match(terms)),
+                Task.user_id == user_id,
+            )
+            .order_by(rank.asc(), Task.id.desc())
+        )
+
+    if dialect == "postgresql":
+        vector = literal_column("tasks.search_vector")
+        query = func.to_tsquery("english", _tsquery(terms))
+        return (
+            select(Task)
+            .where(vector.op("@@")(query), Task.user_id == user_id)
+            .order_by(func.ts_rank_cd(vector, query).desc(), Task.id.desc())
+        )
+
+    return like_statement(user_id, terms)
+
+
+def like_statement(user_id: int, terms: list):
+    """Naive LIKE filter over the same columns (fallback and benchmark baseline)."""
+    stmt = select(Task).where(Task.user_id == user_id)
+    for term in terms:
+        pattern = f"%{term}%"
+        stmt = stmt.where(or_(Task.title.ilike(pattern), Task.description.ilike(pattern)))
+    return stmt.order_by(Task.id.desc())
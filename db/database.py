@@ -1,7 +1,12 @@
 # db/database.py
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+
+from core import metrics
+from core.stage_timer import record_stage
 
 # --------------------------------------------------
 # Database URL resolution (SAFE FOR RENDER + LOCAL)
@@ -17,11 +22,151 @@ if not DATABASE_URL:
 # SQLAlchemy setup
 # --------------------------------------------------
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-    if DATABASE_URL.startswith("sqlite")
-    else {}
+# "tuned" applies the backend profiles below; "default" is the bare engine
+DB_ENGINE_PROFILE = os.getenv("DB_ENGINE_PROFILE", "tuned")
+
+# SQLite (applied to every new connection)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative = KiB, so -65536 is a 64 MiB page cache per connection
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+# Postgres (and any other pooled server backend)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# 0 disables; applied per connection, so migrations opt out explicitly
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+def _install_sqlite_pragmas(engine, url: str) -> None:
+    in_memory = url.split("///")[-1] in ("", ":memory:") or url.endswith("://")
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # WAL: readers no longer block the writer (and vice versa);
+            # NORMAL sync is durable across app crashes, fsyncs on checkpoint
+            if not in_memory:
+                cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        finally:
+            cursor.close()
+
+
+def _sqlite_engine(url: str):
+    engine = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+    )
+    _install_sqlite_pragmas(engine, url)
+    return engine
+
+
+def _pooled_engine(url: str):
+    connect_args = {}
+    if url.startswith("postgresql") and DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+def build_engine(url: str, profile: str = DB_ENGINE_PROFILE):
+    if profile == "default":
+        return create_engine(
+            url,
+            connect_args={"check_same_thread": False}
+            if url.startswith("sqlite")
+            else {}
+        )
+    if profile != "tuned":
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE: {profile!r}")
+
+    if url.startswith("sqlite"):
+        return _sqlite_engine(url)
+    return _pooled_engine(url)
+
+
+engine = build_engine(DATABASE_URL)
+
+
+# --------------------------------------------------
+# Async engine (aiosqlite / asyncpg) for async routers
+# --------------------------------------------------
+
+def async_url(url: str) -> str:
+    """Same database, async driver."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg:" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+
+
+def build_async_engine(url: str, profile: str = DB_ENGINE_PROFILE):
+    if url.startswith("sqlite"):
+        async_engine = create_async_engine(
+            url,
+            connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        )
+        if profile == "tuned":
+            _install_sqlite_pragmas(async_engine.sync_engine, url)
+        return async_engine
+
+    if profile == "default":
+        return create_async_engine(url)
+
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg") and DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+async_engine = build_async_engine(ASYNC_DATABASE_URL)
+
+
+class AsyncBackedSession(Session):
+    """Sync session behind AsyncSessionLocal (own class so events can target it)."""
+
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    # Objects stay readable after commit without a lazy (awaitable) refresh
+    expire_on_commit=False,
+    sync_session_class=AsyncBackedSession,
 )
 
 SessionLocal = sessionmaker(
@@ -30,4 +175,79 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def get_db():
+    # One session per request: FastAPI caches dependencies, so the route
+    # and get_current_user share it
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    # Async counterpart for async endpoints; I/O waits do not hold a thread
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# --------------------------------------------------
+# Write timing (reported as the "db_write" stage)
+# --------------------------------------------------
+# A commit flushes first, so flushes inside a commit are not counted twice
+
+@event.listens_for(SessionLocal, "before_commit")
+@event.listens_for(AsyncBackedSession, "before_commit")
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(AsyncBackedSession, "after_commit")
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        record_stage("db_write", (time.perf_counter() - started) * 1000)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+@event.listens_for(AsyncBackedSession, "after_rollback")
+def _commit_aborted(session):
+    session.info.pop("commit_started", None)
+
+
+@event.listens_for(SessionLocal, "before_flush")
+@event.listens_for(AsyncBackedSession, "before_flush")
+def _flush_started(session, flush_context, instances):
+    if "commit_started" not in session.info:
+        session.info["flush_started"] = time.perf_counter()
+
+
+@event.listens_for(SessionLocal, "after_flush_postexec")
+@event.listens_for(AsyncBackedSession, "after_flush_postexec")
+def _flush_finished(session, flush_context):
+    started = session.info.pop("flush_started", None)
+    if started is not None:
+        record_stage("db_write", (time.perf_counter() - started) * 1000)
+
+
+# --------------------------------------------------
+# Connection pool metrics (read at scrape time)
+# --------------------------------------------------
+
+def _pool_stat(name: str):
+    # SQLite may use a pool without these counters
+    return lambda: getattr(engine.pool, name)()
+
+
+metrics.callback("db_pool_size", "Configured connection pool size", _pool_stat("size"))
+metrics.callback("db_pool_checked_out", "Connections currently in use", _pool_stat("checkedout"))
+metrics.callback("db_pool_overflow", "Connections open beyond the pool size", _pool_stat("overflow"))
+metrics.callback(
+    "db_async_pool_checked_out",
+    "Async engine connections currently in use",
+    lambda: async_engine.pool.checkedout(),
+)
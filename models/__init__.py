@@ -4,3 +4,5 @@ from models.document import *
 from models.agent_run import *
 from models.agent_action import *
 from models.planner_plan import *
+from models.payload_blob import *
+from models.usage_rollup import *
@@ -1,5 +1,5 @@
 #models/agent_action
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Index, text
 from sqlalchemy.sql import func
 from db.database import Base
 
@@ -18,14 +18,40 @@ class AgentAction(Base):
     tool_input = Column(String, nullable=True)
     tool_output = Column(String, nullable=True)
 
+    # Large payloads live in payload_blobs (sha256); the inline column is then NULL
+    tool_input_blob = Column(String(64), nullable=True)
+    tool_output_blob = Column(String(64), nullable=True)
+
     status = Column(
         String,
         nullable=False,
-        default="success",  # success | error | skipped
+        default="success",  # success | error | timeout | cancelled | skipped
     )
 
+    # Monotonic timing relative to the start of the run
+    start_offset_ms = Column(Float, nullable=True)
+    duration_ms = Column(Float, nullable=True)
+
     created_at = Column(
         DateTime(timezone=True),
         server_default=func.now(),
         nullable=False,
     )
+
+    __table_args__ = (
+        # Admin action view: one run's actions in created order
+        Index("ix_agent_actions_run_id_created_at_id", "run_id", "created_at", "id"),
+        # Orphan blob sweep: "is this blob still referenced?" (few rows have one)
+        Index(
+            "ix_agent_actions_tool_input_blob",
+            "tool_input_blob",
+            postgresql_where=text("tool_input_blob IS NOT NULL"),
+            sqlite_where=text("tool_input_blob IS NOT NULL"),
+        ),
+        Index(
+            "ix_agent_actions_tool_output_blob",
+            "tool_output_blob",
+            postgresql_where=text("tool_output_blob IS NOT NULL"),
+            sqlite_where=text("tool_output_blob IS NOT NULL"),
+        ),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from db.database import Base
 
@@ -14,8 +14,24 @@ class AgentRun(Base):
     estimated_tokens_used = Column(Integer, nullable=False, default=0)
     budget_exceeded = Column(Boolean, nullable=False, default=False)
 
+    # Client-supplied key; a retry with the same key replays this run
+    idempotency_key = Column(String(255), nullable=True)
+
     created_at = Column(
         DateTime(timezone=True),
         server_default=func.now(),
         nullable=False,
     )
+
+    __table_args__ = (
+        Index(
+            "ix_agent_runs_user_id_idempotency_key",
+            "user_id",
+            "idempotency_key",
+            unique=True,
+        ),
+        # Per-user history in time order (limiter seeding, listings)
+        Index("ix_agent_runs_user_id_created_at", "user_id", "created_at"),
+        # Keyset pagination of the admin run listing
+        Index("ix_agent_runs_created_at_id", "created_at", "id"),
+    )
@@ -1,5 +1,5 @@
 # models/document.py
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Index
 from sqlalchemy.sql import func
 from db.database import Base
 
@@ -10,3 +10,8 @@ class Document(Base):
     filename = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Keyset pagination of a user's documents
+        Index("ix_documents_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
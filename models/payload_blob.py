@@ -0,0 +1,27 @@
+# models/payload_blob.py
+from sqlalchemy import Column, String, Integer, LargeBinary, DateTime
+from sqlalchemy.sql import func
+from db.database import Base
+
+class PayloadBlob(Base):
+    """zlib-compressed tool payload, addressed by the sha256 of its text."""
+
+    __tablename__ = "payload_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # uncompressed bytes
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    # Refreshed whenever an audit write references the blob again, so the
+    # orphan sweep never deletes a blob an uncommitted action points to
+    last_used_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, JSON, ForeignKey, DateTime, Float, Index
 from sqlalchemy.sql import func
 from db.database import Base
 
@@ -20,11 +20,23 @@ class PlannerPlan(Base):
     status = Column(
         String,
         nullable=False,
-        default="pending",  # pending | executed | skipped | error
+        default="pending",  # pending | executed | skipped | error | timeout | cancelled
     )
 
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Monotonic timing relative to the start of the run
+    start_offset_ms = Column(Float, nullable=True)
+    duration_ms = Column(Float, nullable=True)
+
     created_at = Column(
         DateTime(timezone=True),
         server_default=func.now(),
         nullable=False,
     )
+
+    __table_args__ = (
+        # Run waterfall: one run's steps in plan order
+        Index("ix_planner_plans_run_id_step_index", "run_id", "step_index"),
+    )
@@ -1,6 +1,6 @@
 # app/models/schemas.py
 from pydantic import BaseModel, Field, validator, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Any, Dict
 from enum import Enum
 
 class TaskStatus(str, Enum):
@@ -45,6 +45,42 @@ class TaskResponse(BaseModel):
         from_attributes = True
 
 
+# Bulk task endpoints: items are validated one by one (TaskCreate /
+# TaskBulkUpdateItem), so one bad item fails alone, not the request
+TASKS_BULK_MAX_ITEMS = 1000
+
+
+class TaskBulkRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(..., min_length=1, max_length=TASKS_BULK_MAX_ITEMS)
+
+
+class TaskBulkUpdateItem(TaskUpdate):
+    id: int
+
+
+class TaskBulkDelete(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=TASKS_BULK_MAX_ITEMS)
+
+
+class TaskBulkItemResult(BaseModel):
+    index: int
+    status: int  # HTTP status the single-item endpoint would have returned
+    id: Optional[int] = None
+    task: Optional[TaskResponse] = None
+    error: Optional[Any] = None
+
+
+class TaskBulkResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[TaskBulkItemResult]
+
+
+class AgentBatchRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1, max_length=100)
+    fresh: bool = False
+
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=6, max_length=200)
@@ -1,8 +1,9 @@
 # models/task.py
 from sqlalchemy import Column, Integer, String
 from db.database import Base
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, DDL, event
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -15,3 +16,54 @@ class Task(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     user = relationship("User", back_populates="tasks")
 
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Keyset pagination of a user's tasks
+        Index("ix_tasks_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
+
+# ------------------------------------------------
+# FULL-TEXT SEARCH INDEX (title + description)
+# ------------------------------------------------
+# Maintained by the database itself, so every writer (API, agent tools,
+# bulk statements) keeps it in sync. Same DDL as migration 8d1f3b6c0e27;
+# this copy covers schemas built with create_all.
+TASK_SEARCH_DDL = {
+    "sqlite": [
+        # External-content FTS5 table: the text stays in tasks only
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+        "title, description, content='tasks', content_rowid='id', "
+        "tokenize='porter unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN "
+        "INSERT INTO tasks_fts(rowid, title, description) "
+        "VALUES (new.id, new.title, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); END",
+        # Status changes do not touch the index
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO tasks_fts(rowid, title, description) "
+        "VALUES (new.id, new.title, new.description); END",
+    ],
+    "postgresql": [
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', "
+        "coalesce(title, '') || ' ' || coalesce(description, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING gin (search_vector)",
+    ],
+}
+
+for _dialect, _statements in TASK_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Task.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+
+# Triggers go with the table; the virtual table does not
+event.listen(
+    Task.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS tasks_fts").execute_if(dialect="sqlite"),
+)
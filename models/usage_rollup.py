@@ -0,0 +1,39 @@
+# models/usage_rollup.py
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Index
+from db.database import Base
+
+class UsageRollup(Base):
+    """Agent runs per user per hour/day, maintained by the audit writer."""
+
+    __tablename__ = "usage_rollups"
+
+    granularity = Column(String(8), primary_key=True)  # hour | day
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)  # UTC
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    runs = Column(Integer, nullable=False, default=0)
+    error_runs = Column(Integer, nullable=False, default=0)
+    budget_exceeded_runs = Column(Integer, nullable=False, default=0)
+    tokens_used = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # One user's series
+        Index("ix_usage_rollups_user_id_granularity_bucket", "user_id", "granularity", "bucket_start"),
+    )
+
+
+class ToolUsageRollup(Base):
+    """Tool calls (agent actions) per tool per hour/day."""
+
+    __tablename__ = "tool_usage_rollups"
+
+    granularity = Column(String(8), primary_key=True)  # hour | day
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)  # UTC
+    tool_name = Column(String, primary_key=True)
+
+    calls = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    timeouts = Column(Integer, nullable=False, default=0)
+    # Sum over timed calls only (older rows have no duration)
+    timed_calls = Column(Integer, nullable=False, default=0)
+    duration_ms_total = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,78 @@
+# rag/compression.py
+
+import os
+import re
+
+import numpy as np
+
+from rag.vector_store import embedding_function
+from agent.token_budget import AVG_TOKENS_PER_CHAR, estimate_tokens
+
+
+# ------------------------------------------------
+# CONFIG
+# ------------------------------------------------
+CONTEXT_COMPRESSION_ENABLED = (
+    os.getenv("CONTEXT_COMPRESSION_ENABLED", "false").lower() == "true"
+)
+COMPRESSION_TOKEN_BUDGET = int(os.getenv("COMPRESSION_TOKEN_BUDGET", "300"))
+
+# Sentence ends, or blank lines between retrieved chunks
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def split_sentences(text: str) -> list[str]:
+    return [s.strip() for s in _SENTENCE_BOUNDARY.split(text) if s and s.strip()]
+
+
+def _stats(original: str, compressed: str, kept: int, total: int) -> dict:
+    original_tokens = estimate_tokens(original)
+    compressed_tokens = estimate_tokens(compressed)
+    return {
+        "original_tokens": original_tokens,
+        "compressed_tokens": compressed_tokens,
+        "tokens_saved": original_tokens - compressed_tokens,
+        "compression_ratio": round(compressed_tokens / original_tokens, 4)
+        if original_tokens
+        else 1.0,
+        "sentences_kept": kept,
+        "sentences_total": total,
+    }
+
+
+def compress_context(query: str, context: str, token_budget: int = COMPRESSION_TOKEN_BUDGET):
+    """
+    Keep only the sentences most similar to the query, within token_budget.
+
+    Sentences are scored with the same MiniLM model used for retrieval
+    (one batched embedding call + one mat-vec) and re-emitted in their
+    original order. Returns (compressed_context, stats).
+    """
+    sentences = split_sentences(context or "")
+
+    if not sentences or estimate_tokens(context) <= token_budget:
+        return context, _stats(context or "", context or "", len(sentences), len(sentences))
+
+    vectors = np.asarray(embedding_function.embed_documents(sentences), dtype=np.float32)
+    query_vector = np.asarray(embedding_function.embed_query(query), dtype=np.float32)
+
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    scores = (vectors @ query_vector) / np.where(norms == 0, 1, norms)
+
+    costs = np.array([estimate_tokens(s) for s in sentences])
+    keep = []
+    used = 0
+    for idx in np.argsort(-scores):
+        if used + costs[idx] > token_budget:
+            continue
+        keep.append(idx)
+        used += costs[idx]
+
+    # Always keep at least the best sentence, truncated if needed
+    if not keep:
+        best = sentences[int(np.argmax(scores))]
+        compressed = best[: int(token_budget / AVG_TOKENS_PER_CHAR)]
+        return compressed, _stats(context, compressed, 1, len(sentences))
+
+    compressed = " ".join(sentences[i] for i in sorted(keep))
+    return compressed, _stats(context, compressed, len(keep), len(sentences))
@@ -1,17 +1,57 @@
 #rag/retrieve.py
-from rag.vector_store import get_vector_store
+import time
+
+from rag.vector_store import get_vector_store, embedding_function
+from core.metrics import CHROMA_QUERY_SECONDS
+
+
+def _observe(operation: str, started: float) -> None:
+    CHROMA_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation)
 
 
 def retrieve_context(query: str, user_id: int, k: int = 4) -> str | None:
     vector_store = get_vector_store(user_id)
 
     # 🔒 Check if user has ANY documents at all
-    if vector_store._collection.count() == 0:
+    started = time.perf_counter()
+    count = vector_store._collection.count()
+    _observe("count", started)
+    if count == 0:
         return None  # ← NO DOCUMENT EXISTS
 
+    # Includes embedding the query (also reported as embedding latency)
+    started = time.perf_counter()
     results = vector_store.similarity_search(query, k=k)
+    _observe("similarity_search", started)
 
     if not results:
         return ""  # ← DOC EXISTS, BUT ANSWER NOT FOUND
 
     return "\n\n".join(doc.page_content for doc in results)
+
+
+def retrieve_context_batch(queries: list[str], user_id: int, k: int = 4) -> list[str | None]:
+    """
+    Same contract as retrieve_context, for many queries of one user:
+    all queries are embedded in one batch and sent as one Chroma query.
+    """
+    vector_store = get_vector_store(user_id)
+
+    # 🔒 Check if user has ANY documents at all
+    started = time.perf_counter()
+    count = vector_store._collection.count()
+    _observe("count", started)
+    if count == 0:
+        return [None] * len(queries)
+
+    embeddings = embedding_function.embed_documents(queries)
+
+    started = time.perf_counter()
+    results = vector_store._collection.query(
+        query_embeddings=embeddings,
+        n_results=k,
+        include=["documents"],
+    )
+    _observe("query", started)
+
+    return ["\n\n".join(docs) for docs in results["documents"]]
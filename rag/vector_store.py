@@ -1,11 +1,34 @@
 # rag/vector_store.py
 
 import os
+import time
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 
+from core.metrics import EMBEDDING_SECONDS, EMBEDDING_BATCH_SIZE
 
-embedding_function = HuggingFaceEmbeddings(
+
+class InstrumentedEmbeddings(HuggingFaceEmbeddings):
+    """MiniLM embeddings that report batch size and latency to /metrics."""
+
+    def embed_documents(self, texts):
+        started = time.perf_counter()
+        try:
+            return super().embed_documents(texts)
+        finally:
+            EMBEDDING_SECONDS.observe(time.perf_counter() - started, operation="documents")
+            EMBEDDING_BATCH_SIZE.observe(len(texts), operation="documents")
+
+    def embed_query(self, text):
+        started = time.perf_counter()
+        try:
+            return super().embed_query(text)
+        finally:
+            EMBEDDING_SECONDS.observe(time.perf_counter() - started, operation="query")
+            EMBEDDING_BATCH_SIZE.observe(1, operation="query")
+
+
+embedding_function = InstrumentedEmbeddings(
     model_name="sentence-transformers/all-MiniLM-L6-v2"
 )
 
@@ -0,0 +1,79 @@
+# tests/test_query_plans.py
+"""
+The hot queries (bench/query_plans.py) must keep using the indexes
+added for them. Runs against a small seeded SQLite file.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# Hot query -> index its plan must use
+EXPECTED_INDEXES = {
+    "rate limit window (per user)": "ix_agent_runs_user_id_created_at",
+    "rate limit seed (all users)": "ix_agent_runs_user_id_created_at",
+    "idempotency key lookup": "ix_agent_runs_user_id_idempotency_key",
+    "admin runs, first page": "ix_agent_runs_created_at_id",
+    "admin runs, cursor page": "ix_agent_runs_created_at_id",
+    "admin run actions": "ix_agent_actions_run_id_created_at_id",
+    "run waterfall actions": "ix_agent_actions_run_id_created_at_id",
+    "orphan blob sweep": "ix_agent_actions_tool_output_blob",
+    "run waterfall steps": "ix_planner_plans_run_id_step_index",
+    "task list, first page": "ix_tasks_user_id_created_at_id",
+    "task list, cursor page": "ix_tasks_user_id_created_at_id",
+    "single task": "INTEGER PRIMARY KEY",
+    "document list, cursor page": "ix_documents_user_id_created_at_id",
+}
+
+
+@pytest.fixture(scope="module")
+def plans(tmp_path_factory):
+    """{query name: (table, EXPLAIN QUERY PLAN lines)}"""
+    # db.database builds its engine from DATABASE_URL on first import
+    path = tmp_path_factory.mktemp("query_plans") / "plans.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    from bench.query_plans import explain, hot_queries, seed
+    from db.database import Base, engine
+    import models  # registers every table
+
+    if engine.dialect.name != "sqlite":
+        pytest.skip("query plan assertions are written for SQLite")
+
+    Base.metadata.create_all(engine)
+    ids = seed(engine, scale=0.02)
+
+    with engine.connect() as conn:
+        result = {
+            name: (table, explain(conn, stmt))
+            for name, table, stmt in hot_queries("sqlite", ids)
+        }
+    engine.dispose()
+    return result
+
+
+def test_every_hot_query_is_checked(plans):
+    assert set(plans) == set(EXPECTED_INDEXES)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED_INDEXES))
+def test_hot_query_uses_its_index(plans, name):
+    from bench.query_plans import full_scan
+
+    table, plan = plans[name]
+    assert not full_scan("sqlite", table, plan), plan
+    assert any(
+        line.startswith(("SEARCH", "SCAN")) and EXPECTED_INDEXES[name] in line
+        for line in plan
+    ), plan
+
+
+def test_orphan_sweep_probes_both_blob_indexes(plans):
+    _, plan = plans["orphan blob sweep"]
+    assert any("ix_agent_actions_tool_input_blob" in line for line in plan), plan
+    assert any("ix_agent_actions_tool_output_blob" in line for line in plan), plan